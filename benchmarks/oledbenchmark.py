@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+
+#
+# OLED rendering benchmark, runs without the hardware
+#
+# The OLED module is loaded from ../src and drawn to the in-memory display
+# backend, which counts transactions and bytes.
+#
+# Usage: python3 oledbenchmark.py [iterations]
+#
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from argoneonoled import *
+from argoneonpages import *
+
+
+# Counts files opened, to see the file access per draw
+openctr = 0
+
+def countopen(event, args):
+	global openctr
+	if event == "open":
+		openctr = openctr + 1
+
+# Synthetic fonts and backgrounds, the real ones are installed separately
+def createassets(assetpath):
+	fontlist = [[8, 6], [16, 8]]
+	for curfont in fontlist:
+		fontsize = OLED_NUMFONTCHAR*curfont[1]*(curfont[0]>>3)
+		with open(os.path.join(assetpath, "font"+str(curfont[0])+"x"+str(curfont[1])+".bin"), "wb") as fp:
+			fp.write(bytes([(idx*37)&0xFF for idx in range(fontsize)]))
+	for bgname in ["bgcpu", "bgstorage", "bgraid", "bgram", "bgtemp", "bgip", "bgtime"]:
+		with open(os.path.join(assetpath, bgname+".bin"), "wb") as fp:
+			fp.write(bytes([(idx*13)&0xFF for idx in range(OLED_BUFFERIZE)]))
+
+
+def bench_clearbuffer():
+	oled_clearbuffer(1)
+	oled_clearbuffer()
+
+def bench_filledrectangle():
+	oled_clearbuffer()
+	yoffset = 0
+	while yoffset < oled_getmaxY():
+		oled_drawfilledrectangle(54, yoffset+12, 70, 2)
+		yoffset = yoffset + 16
+
+def bench_pixels():
+	oled_clearbuffer()
+	xpos = 0
+	while xpos < oled_getmaxX():
+		oled_writebuffer(xpos, xpos>>1, 1)
+		xpos = xpos + 1
+
+def bench_storagetext():
+	# Storage page, background and 9 text writes
+	oled_loadbg("bgstorage")
+	yoffset = 16
+	while yoffset < 64:
+		oled_writetextaligned("32GB", 77, yoffset, 128-77, 2, 6)
+		oled_writetextaligned("45%", 50, yoffset, 74-50, 2, 6)
+		oled_writetext("mmcblk0", 0, yoffset, 6)
+		yoffset = yoffset + 16
+
+def bench_unalignedtext():
+	# Temp page text, not aligned to 8 rows
+	oled_clearbuffer()
+	oled_writetext("52.3C", 54, 19, 8)
+	oled_writetext("126.1F", 54, 35, 8)
+
+def bench_uncachedtext():
+	# Storage page text without the rendered text cache
+	sys.modules["argoneonoled"].oled_textcache.clear()
+	bench_storagetext()
+
+def bench_flushimage():
+	oled_flushimage(False, True)
+
+def bench_flushchanged():
+	# Clock minute change, only one block differs from the last frame
+	oled_drawfilledrectangle(100, 40, 8, 16, 1)
+	oled_flushimage(False)
+
+def bench_clockrefresh():
+	# Clock page minute change, only the time field is redrawn
+	global clockminute
+	clockminute = (clockminute + 1) % 60
+	argoneonpages_render("clock", {"date": "OCT19", "weekday": "Mon", "time": "12:{:02d}".format(clockminute)})
+	oled_swapbuffers()
+
+clockminute = 0
+
+def bench_graphscroll():
+	# Graph page, one new sample per refresh
+	historybuffer = argoneonpages_historylist["cpu"]
+	historybuffer.add((historybuffer.count*7) % 100)
+	argoneonpages_render("cpugraph", argoneonpages_graphvalues("cpugraph", historybuffer.getsamples()))
+	oled_swapbuffers()
+
+def bench_scrolltext():
+	# IP page with an address wider than the screen, one scroll step per frame
+	global scrolltime
+	scrolltime = scrolltime + 1/ARGONEONPAGES_SCROLLRATE
+	argoneonpages_render("ip", {"ip": "fe80::1234:5678:9abc:def0"})
+	compiled = argoneonpages_compiledlist["ip"]
+	compiled["scrollstart"]["ip"] = time.monotonic() - ARGONEONPAGES_SCROLLPAUSE - scrolltime
+	argoneonpages_tickscroll("ip")
+	oled_swapbuffers()
+
+scrolltime = 0
+
+def bench_reset():
+	oled_reset()
+
+def bench_frame():
+	bench_filledrectangle()
+	bench_flushimage()
+
+
+benchmarklist = [
+	["clearbuffer", bench_clearbuffer],
+	["filledrectangle", bench_filledrectangle],
+	["pixels", bench_pixels],
+	["storagetext", bench_storagetext],
+	["unalignedtext", bench_unalignedtext],
+	["uncachedtext", bench_uncachedtext],
+	["flushimage", bench_flushimage],
+	["flushchanged", bench_flushchanged],
+	["clockrefresh", bench_clockrefresh],
+	["graphscroll", bench_graphscroll],
+	["scrolltext", bench_scrolltext],
+	["reset", bench_reset],
+	["frame", bench_frame]
+]
+
+def runbenchmark(name, func, iterations, backend):
+	global openctr
+	backend.resetcounters()
+	openctr = 0
+	starttime = time.process_time()
+	ctr = 0
+	while ctr < iterations:
+		func()
+		ctr = ctr + 1
+	elapsed = time.process_time() - starttime
+	return {"name": name, "ms": 1000*elapsed/iterations, "transactions": backend.transactions/iterations, "bytes": backend.bytecount/iterations, "opens": openctr/iterations}
+
+if __name__ == "__main__":
+	iterations = 200
+	if len(sys.argv) > 1:
+		iterations = int(sys.argv[1])
+
+	backend = OledMemoryBackend()
+	oled_setbackend(backend)
+
+	assetdir = tempfile.TemporaryDirectory()
+	createassets(assetdir.name)
+	OLED_ASSETPATH = assetdir.name+"/"
+	sys.modules["argoneonoled"].OLED_ASSETPATH = OLED_ASSETPATH
+	sys.addaudithook(countopen)
+
+	print("{:<20} {:>10} {:>8} {:>8} {:>8}".format("Benchmark", "CPU ms", "I2C tx", "Bytes", "Opens"))
+	for curbench in benchmarklist:
+		result = runbenchmark(curbench[0], curbench[1], iterations, backend)
+		print("{:<20} {:>10.3f} {:>8.0f} {:>8.0f} {:>8.1f}".format(result["name"], result["ms"], result["transactions"], result["bytes"], result["opens"]))
+	textstats = oled_gettextcachestats()
+	print("Text cache: {} hits, {} misses, {:.1f}% hit rate".format(textstats["hits"], textstats["misses"], 100*textstats["hitrate"]))
+	assetdir.cleanup()
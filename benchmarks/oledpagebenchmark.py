@@ -0,0 +1,279 @@
+#!/usr/bin/python3
+
+#
+# OLED page benchmark, runs every display_loop page without the hardware
+#
+# Pages are built from canned argonsysinfo data and drawn through the SSD1306
+# I2C backend to a fake bus. Each page is measured when switched to from another
+# page, and when its data is updated:
+#   CPU ms      - page values, render and flush
+#   OLED calls  - oled_* function calls, including the ones made by other oled_* functions
+#   I2C tx      - bus transactions
+#   Bytes       - bytes sent on the bus
+#
+# The results are compared with the stored baseline, any increase in the counts is a
+# regression (exit code 1). Times depend on the machine, so they are only flagged.
+#
+# Usage: python3 oledpagebenchmark.py [iterations] [--save]
+#   iterations  defaults to the one of the baseline, the canned data is the same on each run
+#   --save      stores the results as the new baseline
+#
+
+import os
+import sys
+import time
+import json
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from argonbus import *
+from argoneonoled import *
+from argoneonpages import *
+from oledbenchmark import createassets
+
+BASELINEFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "oledpagebaseline.json")
+# Times within this ratio of the baseline are not flagged
+TIMETOLERANCE = 0.5
+
+PAGELIST = ["clock", "cpu", "storage", "raid", "ram", "temp", "ip", "cpugraph", "tempgraph", "netgraph", "diskgraph"]
+
+
+# Counts transactions and bytes instead of writing to the bus
+class FakeI2CBus:
+	def __init__(self):
+		self.resetcounters()
+
+	def resetcounters(self):
+		self.transactions = 0
+		self.bytecount = 0
+
+	def write_i2c_block_data(self, addr, register, data):
+		self.transactions = self.transactions + 1
+		self.bytecount = self.bytecount + 1 + len(data)
+
+	def write_raw(self, addr, data):
+		self.transactions = self.transactions + 1
+		self.bytecount = self.bytecount + len(data)
+
+	def write_byte(self, addr, value):
+		self.transactions = self.transactions + 1
+		self.bytecount = self.bytecount + 1
+
+	def close(self):
+		return
+
+
+# Canned argonsysinfo data, changes a little on each frame
+cannedframe = 0
+cannedcpuctr = {}
+
+def canned_cpuusagesnapshot():
+	output = {}
+	for idx in range(4):
+		cpuname = "cpu"+str(idx)
+		prevctr = cannedcpuctr.get(cpuname, {"total": 0, "idle": 0})
+		busy = 10 + (cannedframe*7 + idx*29) % 80
+		output[cpuname] = {"total": prevctr["total"]+100, "idle": prevctr["idle"]+100-busy}
+		cannedcpuctr[cpuname] = output[cpuname]
+	return output
+
+def canned_listhddusage():
+	output = {}
+	idx = 0
+	for devname in ["mmcblk0p2", "nvme0n1p1", "sda1"]:
+		total = (32 << (idx*3))*1024*1024
+		output[devname] = {"used": int(total*(20 + (cannedframe+idx*17) % 70)/100), "total": total}
+		idx = idx + 1
+	return output
+
+def canned_listraid():
+	size = 1953382400
+	raidinfo = {"state": "clean", "raidtype": "raid1", "size": size, "used": int(size*(40 + cannedframe % 50)/100), "devices": 2, "active": 2, "working": 2, "failed": 0, "spare": 0}
+	return {"raidlist": [{"title": "md0", "value": "raid1", "info": raidinfo}], "hddlist": ["sda", "sdb"]}
+
+def canned_ram():
+	return [str(30 + cannedframe % 40)+"%", "8GB"]
+
+def canned_temp():
+	return 45.0 + (cannedframe % 20)/2
+
+def canned_ip():
+	return "192.168.1."+str(20 + cannedframe % 2)
+
+def canned_clock():
+	return datetime.datetime(2026, 10, 19, 12, 0) + datetime.timedelta(minutes=cannedframe)
+
+def canned_nextframe():
+	global cannedframe
+	cannedframe = cannedframe + 1
+	argoneonpages_historylist["cpu"].add((cannedframe*7) % 100)
+	argoneonpages_historylist["temp"].add(45.0 + (cannedframe % 20)/2)
+	argoneonpages_historylist["network"].add((cannedframe*37 % 200)*1024)
+	argoneonpages_historylist["disk"].add((cannedframe*53 % 300)*1024)
+
+# Same data on every run, the history is refilled so the graphs don't depend on earlier frames
+def canned_reset():
+	global cannedframe
+	cannedframe = 0
+	for idx in range(OLED_WD):
+		canned_nextframe()
+
+def setupcanneddata():
+	pagesmodule = sys.modules["argoneonpages"]
+	# Used by the cpu, storage and raid providers
+	pagesmodule.argonsysinfo_getcpuusagesnapshot = canned_cpuusagesnapshot
+	pagesmodule.argonsysinfo_listhddusage = canned_listhddusage
+	pagesmodule.argonsysinfo_listraid = canned_listraid
+	# Pages that use argonsysinfo directly as provider
+	argoneonpages_pagelist["ram"]["provider"] = canned_ram
+	argoneonpages_pagelist["temp"]["provider"] = canned_temp
+	argoneonpages_pagelist["ip"]["provider"] = canned_ip
+	argoneonpages_pagelist["clock"]["provider"] = canned_clock
+
+
+# Counts oled_* calls, wrapped in every module that calls them
+oledcallctr = 0
+
+def countcall(func):
+	def countedfunc(*args, **kwargs):
+		global oledcallctr
+		oledcallctr = oledcallctr + 1
+		return func(*args, **kwargs)
+	return countedfunc
+
+def setcallcounting(enabled):
+	modulelist = [sys.modules["argoneonoled"], sys.modules["argoneonpages"], sys.modules[__name__]]
+	oledmodule = sys.modules["argoneonoled"]
+	for funcname in dir(oledmodule):
+		if funcname[0:5] != "oled_" or callable(getattr(oledmodule, funcname)) == False:
+			continue
+		func = originalfunclist.setdefault(funcname, getattr(oledmodule, funcname))
+		if enabled == True:
+			func = countcall(func)
+		for curmodule in modulelist:
+			if hasattr(curmodule, funcname):
+				setattr(curmodule, funcname, func)
+
+originalfunclist = {}
+
+
+# One display_loop frame: provider, values, render and flush
+def drawframe(pagename):
+	pagedata = argoneonpages_pagelist[pagename]["provider"]()
+	screenlist = argoneonpages_getscreens(pagename, pagedata)
+	argoneonpages_renderscreen(pagename, screenlist[0])
+	oled_swapbuffers()
+
+# Untimed frame before the measured one
+def prepareframe(pagename, mode):
+	if mode == "switch":
+		if pagename == "clock":
+			drawframe("ip")
+		else:
+			drawframe("clock")
+	else:
+		drawframe(pagename)
+	canned_nextframe()
+
+def runbenchmark(pagename, mode, iterations, bus):
+	global oledcallctr
+	# Timed without the call counters
+	setcallcounting(False)
+	canned_reset()
+	elapsed = 0
+	ctr = 0
+	while ctr < iterations:
+		prepareframe(pagename, mode)
+		starttime = time.process_time()
+		drawframe(pagename)
+		elapsed = elapsed + time.process_time() - starttime
+		ctr = ctr + 1
+
+	setcallcounting(True)
+	canned_reset()
+	calls = 0
+	transactions = 0
+	bytecount = 0
+	ctr = 0
+	while ctr < iterations:
+		prepareframe(pagename, mode)
+		oledcallctr = 0
+		bus.resetcounters()
+		drawframe(pagename)
+		calls = calls + oledcallctr
+		transactions = transactions + bus.transactions
+		bytecount = bytecount + bus.bytecount
+		ctr = ctr + 1
+	setcallcounting(False)
+	return {"ms": 1000*elapsed/iterations, "calls": calls/iterations, "transactions": transactions/iterations, "bytes": bytecount/iterations}
+
+# Returns list of differences from the baseline, and whether any is a regression
+def comparebaseline(result, baseline):
+	if baseline is None:
+		return ["new", False]
+	outputlist = []
+	regressionflag = False
+	for curkey in ["calls", "transactions", "bytes"]:
+		# Averages, allow for rounding
+		if result[curkey] > baseline[curkey] + 0.01:
+			outputlist.append(curkey+" +"+str(round(result[curkey]-baseline[curkey], 1)))
+			regressionflag = True
+	if baseline["ms"] > 0 and result["ms"] > baseline["ms"]*(1+TIMETOLERANCE):
+		outputlist.append("slower x{:.2f}".format(result["ms"]/baseline["ms"]))
+	if len(outputlist) == 0:
+		return ["ok", False]
+	return [", ".join(outputlist), regressionflag]
+
+
+if __name__ == "__main__":
+	iterations = 0
+	saveflag = False
+	for curarg in sys.argv[1:]:
+		if curarg == "--save":
+			saveflag = True
+		else:
+			iterations = int(curarg)
+
+	baseline = {"iterations": 50, "results": {}}
+	if saveflag == False:
+		try:
+			with open(BASELINEFILE, "r") as fp:
+				baseline = json.load(fp)
+		except FileNotFoundError:
+			print("No baseline, run with --save to store one")
+	if iterations <= 0:
+		iterations = baseline["iterations"]
+	elif iterations != baseline["iterations"]:
+		print("Baseline is for "+str(baseline["iterations"])+" iterations, the counts may differ")
+
+	bus = FakeI2CBus()
+	argonbus_setdevice(bus)
+	oled_setbackend(OledPanelBackend())
+
+	assetdir = tempfile.TemporaryDirectory()
+	createassets(assetdir.name)
+	sys.modules["argoneonoled"].OLED_ASSETPATH = assetdir.name+"/"
+	setupcanneddata()
+
+	resultlist = {}
+	regressionflag = False
+	print("{:<12} {:<8} {:>8} {:>10} {:>8} {:>8}  {}".format("Page", "Frame", "CPU ms", "OLED calls", "I2C tx", "Bytes", "Baseline"))
+	for pagename in PAGELIST:
+		for mode in ["switch", "update"]:
+			result = runbenchmark(pagename, mode, iterations, bus)
+			resultlist[pagename+":"+mode] = result
+			comparison = comparebaseline(result, baseline["results"].get(pagename+":"+mode))
+			if comparison[1] == True:
+				regressionflag = True
+			print("{:<12} {:<8} {:>8.3f} {:>10.1f} {:>8.1f} {:>8.1f}  {}".format(pagename, mode, result["ms"], result["calls"], result["transactions"], result["bytes"], comparison[0]))
+	argoneonpages_stopproviders()
+	assetdir.cleanup()
+
+	if saveflag == True:
+		with open(BASELINEFILE, "w") as fp:
+			json.dump({"iterations": iterations, "results": resultlist}, fp, indent=1, sort_keys=True)
+		print("Baseline saved to "+BASELINEFILE)
+	elif regressionflag == True:
+		print("Regression from baseline")
+		sys.exit(1)
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+
+#
+# RTC schedule benchmark, runs without the hardware
+#
+# Times the next fire time lookup of setNextAlarm (getNextCommandScheduleTime) for
+# schedule lists of increasing size and for edge dates, and checks the results
+# against a minute by minute search. Also times the per minute check of dense
+# schedule lines (getCommandForTime).
+#
+# Usage: python3 rtcschedulebenchmark.py [iterations]
+#
+
+import os
+import sys
+import time
+import random
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import argoneond
+
+
+# Start times around month ends, leap days and the end of the year
+EDGETIMELIST = [
+	datetime.datetime(2028, 2, 28, 23, 59, 30),
+	datetime.datetime(2028, 2, 29, 12, 0),
+	datetime.datetime(2027, 2, 28, 12, 0),
+	datetime.datetime(2026, 1, 31, 23, 59),
+	datetime.datetime(2026, 4, 30, 23, 59, 59),
+	datetime.datetime(2026, 12, 31, 23, 59)
+]
+
+# Schedule from "min hour date month dayOfWeek", the config file ignores the month
+def newschedule(fieldstr, cmd = "on"):
+	fieldlist = fieldstr.split(" ")
+	output = {"cmd": cmd}
+	idx = 0
+	for fieldinfo in argoneond.RTC_SCHEDULEFIELDLIST:
+		if fieldinfo[0] == "weekday":
+			valuelist = argoneond.getConfigWeekdayValue(fieldlist[idx])
+		else:
+			valuelist = argoneond.getConfigValue(fieldlist[idx], fieldinfo[1], fieldinfo[2])
+		output[fieldinfo[0]] = argoneond.getConfigMask(valuelist, fieldinfo[1], fieldinfo[2])
+		idx = idx + 1
+	return output
+
+# Schedules that are far apart or rare
+EDGESCHEDULELIST = [
+	["31st", "0 1 31 * *"],
+	["29th", "30 6 29 * *"],
+	["Feb 29", "0 0 29 2 *"],
+	["Feb 29 Monday", "0 0 29 2 1"],
+	["31st Sunday", "59 23 31 * 7"],
+	["Every minute", "* * * * *"],
+	["Never (Apr 31)", "0 0 31 4 *"]
+]
+
+# Dense config lines, each used to be expanded to one entry per combination
+DENSESCHEDULELIST = [
+	"0,15,30,45 * * * * off",
+	"*/5 0-23 * * 1-5 off",
+	"*/15 8-18 1-31 * 0-6 off",
+	"0-59 0-23 1-31 * 0-6 off"
+]
+
+def randomschedule():
+	return newschedule(" ".join([
+		random.choice(["0", "15", "*/15", "0,30", str(random.randrange(60))]),
+		random.choice(["*", "8-18", str(random.randrange(24))]),
+		random.choice(["*", "*", "*", str(random.randrange(1, 32)), "1-7"]),
+		"*",
+		random.choice(["*", "*", "1-5", str(random.randrange(8))])
+	]))
+
+# Minute by minute search, skipping days that don't match
+def findnexttime(commandschedule, aftertime):
+	testtime = aftertime.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+	endtime = aftertime.replace(year=aftertime.year+argoneond.RTC_SCHEDULELIMITYEARS, day=1)
+	dayschedule = dict(commandschedule)
+	dayschedule["minute"] = argoneond.getConfigMask([-1], 0, 59)
+	dayschedule["hour"] = argoneond.getConfigMask([-1], 0, 23)
+	while testtime < endtime:
+		if argoneond.checkDateForCommandSchedule(dayschedule, testtime) == True:
+			curday = testtime.day
+			while testtime.day == curday:
+				if argoneond.checkDateForCommandSchedule(commandschedule, testtime) == True:
+					return testtime
+				testtime = testtime + datetime.timedelta(minutes=1)
+		else:
+			testtime = (testtime + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+	return None
+
+def checkresults():
+	errorctr = 0
+	checkctr = 0
+	schedulelist = [newschedule(curitem[1]) for curitem in EDGESCHEDULELIST if curitem[0] != "Feb 29 Monday"]
+	for curtime in EDGETIMELIST:
+		for curschedule in schedulelist + [randomschedule() for idx in range(20)]:
+			checkctr = checkctr + 1
+			if argoneond.getNextCommandScheduleTime(curschedule, curtime) != findnexttime(curschedule, curtime):
+				errorctr = errorctr + 1
+				print("Mismatch:", curschedule, curtime)
+	print(str(checkctr)+" checks, "+str(errorctr)+" errors")
+	print("")
+
+def timeschedulelist(schedulelist, starttime, iterations):
+	elapsed = 0
+	ctr = 0
+	while ctr < iterations:
+		begintime = time.process_time()
+		for curschedule in schedulelist:
+			argoneond.getNextCommandScheduleTime(curschedule, starttime)
+		elapsed = elapsed + time.process_time() - begintime
+		ctr = ctr + 1
+	return elapsed/iterations
+
+
+if __name__ == "__main__":
+	iterations = 20
+	if len(sys.argv) > 1:
+		iterations = int(sys.argv[1])
+	random.seed(1)
+
+	checkresults()
+
+	starttime = datetime.datetime(2026, 10, 19, 12, 0, 30)
+	print("{:<20} {:>10} {:>12}".format("Schedule list", "List ms", "us per entry"))
+	for listsize in [10, 100, 1000, 10000]:
+		schedulelist = [randomschedule() for idx in range(listsize)]
+		elapsed = timeschedulelist(schedulelist, starttime, max(1, iterations*10//listsize))
+		print("{:<20} {:>10.3f} {:>12.2f}".format(str(listsize)+" entries", 1000*elapsed, 1000000*elapsed/listsize))
+
+	print("")
+	print("{:<20} {:>10} {:>20}".format("Edge schedule", "us", "Next (from Feb 28)"))
+	for curitem in EDGESCHEDULELIST:
+		curschedule = newschedule(curitem[1])
+		elapsed = timeschedulelist([curschedule], EDGETIMELIST[2], iterations*10)
+		print("{:<20} {:>10.2f} {:>20}".format(curitem[0], 1000000*elapsed, str(argoneond.getNextCommandScheduleTime(curschedule, EDGETIMELIST[2]))))
+
+	print("")
+	print("{:<28} {:>8} {:>10} {:>14}".format("Config line", "Entries", "Expanded", "us per minute"))
+	for curline in DENSESCHEDULELIST:
+		schedulelist = argoneond.formCommandScheduleList([curline])
+		linedata = curline.split(" ")
+		# Entry count of the per combination expansion
+		expandedctr = len(argoneond.getConfigValue(linedata[0], 0, 59))*len(argoneond.getConfigValue(linedata[1], 0, 23))*len(argoneond.getConfigValue(linedata[2], 1, 31))*len(argoneond.getConfigWeekdayValue(linedata[4]))
+		# A day of per minute checks
+		testtime = starttime
+		begintime = time.process_time()
+		ctr = 0
+		while ctr < 1440:
+			argoneond.getCommandForTime(schedulelist, testtime, "off")
+			testtime = testtime + datetime.timedelta(minutes=1)
+			ctr = ctr + 1
+		elapsed = time.process_time() - begintime
+		print("{:<28} {:>8} {:>10} {:>14.2f}".format(curline, len(schedulelist), expandedctr, 1000000*elapsed/1440))
@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+
+#
+# Shared I2C bus manager for the Argon scripts.
+#
+# Fan, OLED and RTC share one bus handle. Transactions are serialized with a lock,
+# and waiting transactions are served by priority so a fan or power command does
+# not wait behind an OLED frame. Failed transactions are retried with backoff.
+#
+
+import os
+import time
+import errno
+import fcntl
+import threading
+import heapq
+
+# Lower value is served first
+ARGONBUS_PRIORITY_POWER = 0
+ARGONBUS_PRIORITY_FAN = 1
+ARGONBUS_PRIORITY_RTC = 2
+ARGONBUS_PRIORITY_OLED = 3
+
+ARGONBUS_RETRYCOUNT = 3
+# Delay before the first retry, doubles on each attempt
+ARGONBUS_RETRYDELAY = 0.01
+
+# SMBus block writes are limited to 32 bytes
+ARGONBUS_BLOCKSIZE = 32
+
+# ioctl to set the target address of /dev/i2c-N writes
+ARGONBUS_I2C_SLAVE = 0x0703
+# Errors that mean raw writes can't work at all, instead of a failed transfer
+ARGONBUS_UNSUPPORTEDERRNOLIST = [errno.ENOTTY, errno.EOPNOTSUPP, errno.ENOENT, errno.ENODEV]
+
+argonbus_device = None
+# Set when argonbus opened the bus itself, raw writes only go to that bus
+argonbus_busnumber = -1
+argonbus_rawfd = -1
+argonbus_condition = threading.Condition()
+argonbus_waitlist = []
+argonbus_ticketctr = 0
+argonbus_busy = False
+
+# Per-device counters, keyed by address
+argonbus_stats = {}
+
+
+def argonbus_getbusnumber():
+	import RPi.GPIO as GPIO
+	rev = GPIO.RPI_REVISION
+	if rev == 2 or rev == 3:
+		return 1
+	return 0
+
+# Opens the bus on first use, so importing modules don't need the hardware
+
+def argonbus_getdevice():
+	global argonbus_device, argonbus_busnumber
+	if argonbus_device is None:
+		import smbus
+		argonbus_busnumber = argonbus_getbusnumber()
+		argonbus_device = smbus.SMBus(argonbus_busnumber)
+	return argonbus_device
+
+# Replace the bus object (e.g. a fake bus when there's no hardware)
+
+def argonbus_setdevice(device):
+	global argonbus_device
+	argonbus_close()
+	argonbus_device = device
+
+def argonbus_close():
+	global argonbus_device, argonbus_busnumber, argonbus_rawfd
+	if argonbus_device is not None:
+		try:
+			argonbus_device.close()
+		except:
+			pass
+	if argonbus_rawfd >= 0:
+		os.close(argonbus_rawfd)
+	argonbus_device = None
+	argonbus_busnumber = -1
+	argonbus_rawfd = -1
+
+# Raw writes go through /dev/i2c-N, which isn't limited to 32 bytes like SMBus block writes
+# Devices set with argonbus_setdevice can provide their own write_raw(addr, data)
+
+def argonbus_writerawfd(addr, data):
+	global argonbus_rawfd
+	if argonbus_busnumber < 0:
+		raise IOError(errno.EOPNOTSUPP, "Raw I2C writes not available")
+	if argonbus_rawfd < 0:
+		argonbus_rawfd = os.open("/dev/i2c-"+str(argonbus_busnumber), os.O_RDWR)
+	fcntl.ioctl(argonbus_rawfd, ARGONBUS_I2C_SLAVE, addr)
+	if os.write(argonbus_rawfd, data) != len(data):
+		raise IOError("Incomplete I2C write")
+
+def argonbus_isunsupported(e):
+	return e.errno in ARGONBUS_UNSUPPORTEDERRNOLIST
+
+def argonbus_getmethod(methodname):
+	device = argonbus_getdevice()
+	if methodname == "write_raw" and hasattr(device, "write_raw") == False:
+		return argonbus_writerawfd
+	return getattr(device, methodname)
+
+# Waits until the bus is free and no higher priority transaction is waiting
+
+def argonbus_acquire(priority):
+	global argonbus_ticketctr, argonbus_busy
+	with argonbus_condition:
+		argonbus_ticketctr = argonbus_ticketctr + 1
+		ticket = (priority, argonbus_ticketctr)
+		heapq.heappush(argonbus_waitlist, ticket)
+		while argonbus_busy == True or argonbus_waitlist[0] != ticket:
+			argonbus_condition.wait()
+		heapq.heappop(argonbus_waitlist)
+		argonbus_busy = True
+
+def argonbus_release():
+	global argonbus_busy
+	with argonbus_condition:
+		argonbus_busy = False
+		argonbus_condition.notify_all()
+
+def argonbus_updatestats(addr, elapsed, retries, failed):
+	with argonbus_condition:
+		curstats = argonbus_stats.get(addr)
+		if curstats is None:
+			curstats = {"count": 0, "errors": 0, "retries": 0, "totaltime": 0.0, "maxtime": 0.0}
+			argonbus_stats[addr] = curstats
+		curstats["count"] = curstats["count"] + 1
+		curstats["retries"] = curstats["retries"] + retries
+		curstats["totaltime"] = curstats["totaltime"] + elapsed
+		if elapsed > curstats["maxtime"]:
+			curstats["maxtime"] = elapsed
+		if failed == True:
+			curstats["errors"] = curstats["errors"] + 1
+
+# Runs one bus call under the lock, retrying on IOError
+# The bus is released between retries so other devices aren't held up by the backoff
+
+def argonbus_transaction(addr, priority, retries, methodname, *args):
+	attempt = 0
+	retrydelay = ARGONBUS_RETRYDELAY
+	while True:
+		argonbus_acquire(priority)
+		starttime = time.monotonic()
+		try:
+			result = argonbus_getmethod(methodname)(addr, *args)
+			argonbus_updatestats(addr, time.monotonic()-starttime, attempt, False)
+			return result
+		except IOError as e:
+			if attempt >= retries or argonbus_isunsupported(e) == True:
+				argonbus_updatestats(addr, time.monotonic()-starttime, attempt, True)
+				raise
+		finally:
+			argonbus_release()
+		time.sleep(retrydelay)
+		retrydelay = retrydelay*2
+		attempt = attempt + 1
+
+
+def argonbus_writebyte(addr, value, priority = ARGONBUS_PRIORITY_RTC, retries = ARGONBUS_RETRYCOUNT):
+	argonbus_transaction(addr, priority, retries, "write_byte", value)
+
+def argonbus_readbyte(addr, priority = ARGONBUS_PRIORITY_RTC, retries = ARGONBUS_RETRYCOUNT):
+	return argonbus_transaction(addr, priority, retries, "read_byte")
+
+def argonbus_writebytedata(addr, register, value, priority = ARGONBUS_PRIORITY_RTC, retries = ARGONBUS_RETRYCOUNT):
+	argonbus_transaction(addr, priority, retries, "write_byte_data", register, value)
+
+def argonbus_readbytedata(addr, register, priority = ARGONBUS_PRIORITY_RTC, retries = ARGONBUS_RETRYCOUNT):
+	return argonbus_transaction(addr, priority, retries, "read_byte_data", register)
+
+# Data can be any sequence of byte values (list, bytes, bytearray, memoryview)
+
+def argonbus_writeblockdata(addr, register, data, priority = ARGONBUS_PRIORITY_RTC, retries = ARGONBUS_RETRYCOUNT):
+	argonbus_transaction(addr, priority, retries, "write_i2c_block_data", register, list(data))
+
+# Register byte followed by data in one raw write, no length limit
+# Raises IOError if not supported (see argonbus_isunsupported), callers should then fall back
+# to argonbus_writeblockdata
+
+def argonbus_writerawblockdata(addr, register, data, priority = ARGONBUS_PRIORITY_RTC, retries = ARGONBUS_RETRYCOUNT):
+	argonbus_transaction(addr, priority, retries, "write_raw", bytes([register])+bytes(data))
+
+# Sends back-to-back command bytes for the same register as block writes,
+# instead of one transaction per byte
+
+def argonbus_writecommands(addr, register, cmdlist, priority = ARGONBUS_PRIORITY_RTC, retries = ARGONBUS_RETRYCOUNT):
+	idx = 0
+	while idx < len(cmdlist):
+		argonbus_writeblockdata(addr, register, cmdlist[idx:idx+ARGONBUS_BLOCKSIZE], priority, retries)
+		idx = idx + ARGONBUS_BLOCKSIZE
+
+
+# Returns copy of per-device counters: count, errors, retries, totaltime, maxtime (seconds)
+
+def argonbus_getstats():
+	output = {}
+	with argonbus_condition:
+		for addr in argonbus_stats:
+			output[addr] = dict(argonbus_stats[addr])
+	return output
+
+def argonbus_describestats():
+	outputlist = []
+	curstats = argonbus_getstats()
+	for addr in sorted(curstats):
+		tmpitem = curstats[addr]
+		avgms = 0
+		if tmpitem["count"] > 0:
+			avgms = 1000*tmpitem["totaltime"]/tmpitem["count"]
+		outputlist.append("0x{:02x}: {} transactions, {} errors, {} retries, avg {:.2f}ms, max {:.2f}ms".format(addr, tmpitem["count"], tmpitem["errors"], tmpitem["retries"], avgms, 1000*tmpitem["maxtime"]))
+	return outputlist
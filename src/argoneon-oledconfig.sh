@@ -1,6 +1,8 @@
 #!/bin/bash
 
 oledconfigfile=/etc/argoneonoled.conf
+# Custom pages, see argoneonpages.py
+oledplugindir=/etc/argon/pages.d
 
 get_number () {
 	read curnumber
@@ -48,13 +50,39 @@ get_pagename() {
 	elif [ "$1" == "ip" ]
 	then
 		pagename="IP Address"
+	elif [ "$1" == "cpugraph" ]
+	then
+		pagename="CPU Utilization Graph"
+	elif [ "$1" == "tempgraph" ]
+	then
+		pagename="CPU Temperature Graph"
+	elif [ "$1" == "netgraph" ]
+	then
+		pagename="Network Traffic Graph"
+	elif [ "$1" == "diskgraph" ]
+	then
+		pagename="Disk Activity Graph"
+	elif [ -f "$oledplugindir/$1.py" ]
+	then
+		pagename=$(sed -n 's/^PAGE_TITLE *= *"\(.*\)".*/\1/p' "$oledplugindir/$1.py" | head -n 1)
+		if [ -z "$pagename" ]
+		then
+			pagename="$1"
+		fi
 	else
 		pagename="Invalid"
 	fi
 }
 
 configure_pagelist () {
-	pagemasterlist="clock cpu storage raid ram temp ip"
+	pagemasterlist="clock cpu storage raid ram temp ip cpugraph tempgraph netgraph diskgraph"
+	for curplugin in "$oledplugindir"/*.py
+	do
+		if [ -f "$curplugin" ]
+		then
+			pagemasterlist="$pagemasterlist $(basename "$curplugin" .py)"
+		fi
+	done
 	newscreenlist="$1"
 	pageloopflag=1
 	while [ $pageloopflag -eq 1 ]
@@ -150,6 +178,11 @@ saveconfig () {
 	echo "switchduration=$2" >> $oledconfigfile
 	echo "screensaver=$3" >> $oledconfigfile
 	echo "screenlist=\"$4\"" >> $oledconfigfile
+	if [ ! -z "$5" ]
+	then
+		# Not in the menu, kept as set by hand
+		echo "scrollrate=$5" >> $oledconfigfile
+	fi
 }
 
 updateconfig=1
@@ -189,7 +222,7 @@ do
 	# Write default values to config file, daemon already uses default so no need to restart service
 	if [ $updateconfig -eq 1 ]
 	then
-		saveconfig $enabled $switchduration $screensaver "$screenlist"
+		saveconfig $enabled $switchduration $screensaver "$screenlist" "$scrollrate"
 		updateconfig=0
 	fi
 
@@ -286,7 +319,7 @@ do
 
 	if [ $updateconfig -eq 1 ]
 	then
-		saveconfig $enabled $switchduration $screensaver "$screenlist"
+		saveconfig $enabled $switchduration $screensaver "$screenlist" "$scrollrate"
 		sudo systemctl restart argononed.service
 	fi
 done
@@ -37,6 +37,16 @@ get_number () {
 	return
 }
 
+# RTC scheduler runs in argononed.service when using the combined service
+restart_rtcservice () {
+	if systemctl is-enabled --quiet argoneond.service &> /dev/null
+	then
+		sudo systemctl restart argoneond.service
+	else
+		sudo systemctl restart argononed.service
+	fi
+}
+
 configure_schedule () {
 	scheduleloopflag=1
 	while [ $scheduleloopflag -eq 1 ]
@@ -78,7 +88,7 @@ configure_schedule () {
 			if [ "$confirm" = "Y" ]
 			then
 				$pythonbin $argoneonrtcscript REMOVESCHEDULE $newmode
-				sudo systemctl restart argoneond.service
+				restart_rtcservice
 			fi
 			echo ""
 		fi
@@ -241,7 +251,7 @@ configure_newschedule () {
 			fi
 
 			echo "$minute $hour * * $cronweekday $cmdcode" >> $rtcconfigfile
-			sudo systemctl restart argoneond.service
+			restart_rtcservice
 			subloopflag=0
 		fi
 	done
@@ -303,7 +313,7 @@ configure_newcron () {
 					if [[ $minute -ge 0 && $minute -le 59 ]]
 					then
 						echo "$minute * * * * $cmdcode" >> $rtcconfigfile
-						sudo systemctl restart argoneond.service
+						restart_rtcservice
 						subloopflag=0
 					else
 						echo "Invalid value"
@@ -317,7 +327,7 @@ configure_newcron () {
 					if [[ $minute -ge 0 && $minute -le 59 && $hour -ge 0 && $hour -le 23 ]]
 					then
 						echo "$minute $hour * * * $cmdcode" >> $rtcconfigfile
-						sudo systemctl restart argoneond.service
+						restart_rtcservice
 						subloopflag=0
 					else
 						echo "Invalid value(s)"
@@ -343,7 +353,7 @@ configure_newcron () {
 					if [[ $minute -ge 0 && $minute -le 59 && $hour -ge 0 && $hour -le 23 && $weekday -ge 0 && $weekday -le 6 ]]
 					then
 						echo "$minute $hour * * $weekday $cmdcode" >> $rtcconfigfile
-						sudo systemctl restart argoneond.service
+						restart_rtcservice
 						subloopflag=0
 					else
 						echo "Invalid value(s)"
@@ -364,7 +374,7 @@ configure_newcron () {
 					if [[ $minute -ge 0 && $minute -le 59 && $hour -ge 0 && $hour -le 23 && $monthday -ge 1 && $monthday -le 31 ]]
 					then
 						echo "$minute $hour $monthday * * $cmdcode" >> $rtcconfigfile
-						sudo systemctl restart argoneond.service
+						restart_rtcservice
 						subloopflag=0
 					else
 						echo "Invalid value(s)"
@@ -7,16 +7,12 @@ import math
 
 import os
 import time
+import errno
+import ctypes
 
-# Initialize I2C Bus
-import smbus
-import RPi.GPIO as GPIO
-
-rev = GPIO.RPI_REVISION
-if rev == 2 or rev == 3:
-	bus=smbus.SMBus(1)
-else:
-	bus=smbus.SMBus(0)
+# Shared I2C Bus
+sys.path.append("/etc/argon/")
+from argonbus import *
 
 
 ADDR_RTC=0x51
@@ -42,16 +38,16 @@ def numDECtoBCD(val):
 	
 # Check if Event Bit is raised
 def hasRTCEventFlag(flagbit):
-	bus.write_byte(ADDR_RTC,1)
-	out = bus.read_byte_data(ADDR_RTC, 1)
+	argonbus_writebyte(ADDR_RTC,1)
+	out = argonbus_readbytedata(ADDR_RTC, 1)
 	return (out & flagbit) != 0
 
 # Clear Event Bit if raised
 def clearRTCEventFlag(flagbit):
-	out = bus.read_byte_data(ADDR_RTC, 1)
+	out = argonbus_readbytedata(ADDR_RTC, 1)
 	if (out & flagbit) != 0:
 		# Unset only if fired
-		bus.write_byte_data(ADDR_RTC, 1, out&(0xff-flagbit))
+		argonbus_writebytedata(ADDR_RTC, 1, out&(0xff-flagbit))
 		return True
 	return False
 
@@ -67,8 +63,8 @@ def setRTCEventFlag(flagbit, enabled):
 		disableflagbit = enableflagbit
 		enableflagbit = 0
 
-	out = bus.read_byte_data(ADDR_RTC, 1)
-	bus.write_byte_data(ADDR_RTC, 1, (out&(0xff-flagbit-disableflagbit - ti_tp_flag))|enableflagbit)
+	out = argonbus_readbytedata(ADDR_RTC, 1)
+	argonbus_writebytedata(ADDR_RTC, 1, (out&(0xff-flagbit-disableflagbit - ti_tp_flag))|enableflagbit)
 
 # Helper method to add proper suffix to numbers
 def getNumberSuffix(numval):
@@ -83,7 +79,7 @@ def getNumberSuffix(numval):
 
 # Describe Timer Setting
 def describeTimer(showsetting):
-	out = bus.read_byte_data(ADDR_RTC, 14)
+	out = argonbus_readbytedata(ADDR_RTC, 14)
 	tmp = out & 3
 	if tmp == 3:
 		outstr = " Minute(s)"
@@ -95,7 +91,7 @@ def describeTimer(showsetting):
 		outstr = "/4096th Second"
 
 	if (out & 0x80) != 0:
-		out = bus.read_byte_data(ADDR_RTC, 15)
+		out = argonbus_readbytedata(ADDR_RTC, 15)
 		return "Every "+(numBCDtoDEC(out)+1)+outstr
 	elif showsetting == True:
 		return "Disabled (Interval every 1"+outstr+")"
@@ -237,19 +233,19 @@ def describeAlarm():
 	date = -1
 	weekday = -1
 
-	out = bus.read_byte_data(ADDR_RTC, 9)
+	out = argonbus_readbytedata(ADDR_RTC, 9)
 	if (out & 0x80) == 0:
 		minute = numBCDtoDEC(out & 0x7f)
 
-	out = bus.read_byte_data(ADDR_RTC, 10)
+	out = argonbus_readbytedata(ADDR_RTC, 10)
 	if (out & 0x80) == 0:
 		hour = numBCDtoDEC(out & 0x3f)
 
-	out = bus.read_byte_data(ADDR_RTC, 11)
+	out = argonbus_readbytedata(ADDR_RTC, 11)
 	if (out & 0x80) == 0:
 		date = numBCDtoDEC(out & 0x3f)
 
-	out = bus.read_byte_data(ADDR_RTC, 12)
+	out = argonbus_readbytedata(ADDR_RTC, 12)
 	if (out & 0x80) == 0:
 		weekday = numBCDtoDEC(out & 0x7)
 
@@ -265,7 +261,7 @@ def describeAlarm():
 
 # Describe Control Flags
 def describeControlRegisters():
-	out = bus.read_byte_data(ADDR_RTC, 1)
+	out = argonbus_readbytedata(ADDR_RTC, 1)
 
 	print("\n***************")
 	print("Control Status 2")
@@ -352,12 +348,12 @@ def clearRTCAlarmFlag():
 # Enables RTC Alarm Register
 def enableAlarm(registeraddr, value, mask):
 	# 0x00 is Enabled
-	bus.write_byte_data(ADDR_RTC, registeraddr, (numDECtoBCD(value)&mask))
+	argonbus_writebytedata(ADDR_RTC, registeraddr, (numDECtoBCD(value)&mask))
 
 # Disables RTC Alarm Register
 def disableAlarm(registeraddr):
 	# 0x80 is disabled
-	bus.write_byte_data(ADDR_RTC, registeraddr, 0x80)
+	argonbus_writebytedata(ADDR_RTC, registeraddr, 0x80)
 
 # Removes all alarm settings
 def removeRTCAlarm():
@@ -442,8 +438,8 @@ def removeRTCTimer():
 	setRTCEventFlag(RTC_TIMER_BIT, False)
 
 	# Timer disable and Set Timer frequency to lowest (0x3=1 per minute)
-	bus.write_byte_data(ADDR_RTC, 14, 3)
-	bus.write_byte_data(ADDR_RTC, 15, 0)
+	argonbus_writebytedata(ADDR_RTC, 14, 3)
+	argonbus_writebytedata(ADDR_RTC, 15, 0)
 
 # Set RTC Timer Interval
 def setRTCTimerInterval(enableflag, value, inSeconds = False):
@@ -457,8 +453,8 @@ def setRTCTimerInterval(enableflag, value, inSeconds = False):
 	if inSeconds == True:
 		timerconfigFlag = 0x82
 
-	bus.write_byte_data(ADDR_RTC, 14, timerconfigFlag)
-	bus.write_byte_data(ADDR_RTC, 15, numDECtoBCD(value&0xff))
+	argonbus_writebytedata(ADDR_RTC, 14, timerconfigFlag)
+	argonbus_writebytedata(ADDR_RTC, 15, numDECtoBCD(value&0xff))
 	return 0
 
 #############
@@ -478,29 +474,29 @@ def getLocaltimeOffset():
 def getRTCdatetime():
 
 	# Data Sheet Recommends to read this manner (instead of from registers)
-	bus.write_byte(ADDR_RTC,2)
+	argonbus_writebyte(ADDR_RTC,2)
 
-	out = bus.read_byte(ADDR_RTC)
+	out = argonbus_readbyte(ADDR_RTC)
 	out = numBCDtoDEC(out & 0x7f)
 	second = out
 	#warningflag = (out & 0x80)>>7
 
-	out = bus.read_byte(ADDR_RTC)
+	out = argonbus_readbyte(ADDR_RTC)
 	minute = numBCDtoDEC(out & 0x7f)
 
-	out = bus.read_byte(ADDR_RTC)
+	out = argonbus_readbyte(ADDR_RTC)
 	hour = numBCDtoDEC(out & 0x3f)
 
-	out = bus.read_byte(ADDR_RTC)
+	out = argonbus_readbyte(ADDR_RTC)
 	date = numBCDtoDEC(out & 0x3f)
 
-	out = bus.read_byte(ADDR_RTC)
+	out = argonbus_readbyte(ADDR_RTC)
 	#weekDay = numBCDtoDEC(out & 7)
 
-	out = bus.read_byte(ADDR_RTC)
+	out = argonbus_readbyte(ADDR_RTC)
 	month = numBCDtoDEC(out & 0x1f)
 
-	out = bus.read_byte(ADDR_RTC)
+	out = argonbus_readbyte(ADDR_RTC)
 	year = numBCDtoDEC(out)
 
 	#print({"year":year, "month": month, "date": date, "hour": hour, "minute": minute, "second": second})
@@ -529,15 +525,15 @@ def setRTCdatetime(localdatetime):
 		weekDay = weekDay + 1
 
 	# Write to respective registers
-	bus.write_byte_data(ADDR_RTC,2,numDECtoBCD(localdatetime.second))
-	bus.write_byte_data(ADDR_RTC,3,numDECtoBCD(localdatetime.minute))
-	bus.write_byte_data(ADDR_RTC,4,numDECtoBCD(localdatetime.hour))
-	bus.write_byte_data(ADDR_RTC,5,numDECtoBCD(localdatetime.day))
-	bus.write_byte_data(ADDR_RTC,6,numDECtoBCD(weekDay))
-	bus.write_byte_data(ADDR_RTC,7,numDECtoBCD(localdatetime.month))
+	argonbus_writebytedata(ADDR_RTC,2,numDECtoBCD(localdatetime.second))
+	argonbus_writebytedata(ADDR_RTC,3,numDECtoBCD(localdatetime.minute))
+	argonbus_writebytedata(ADDR_RTC,4,numDECtoBCD(localdatetime.hour))
+	argonbus_writebytedata(ADDR_RTC,5,numDECtoBCD(localdatetime.day))
+	argonbus_writebytedata(ADDR_RTC,6,numDECtoBCD(weekDay))
+	argonbus_writebytedata(ADDR_RTC,7,numDECtoBCD(localdatetime.month))
 
 	# Year is from 2000
-	bus.write_byte_data(ADDR_RTC,8,numDECtoBCD(localdatetime.year-2000))
+	argonbus_writebytedata(ADDR_RTC,8,numDECtoBCD(localdatetime.year-2000))
 
 # Sync Time to RTC Time (for Daemon use)
 def syncSystemTime():
@@ -549,30 +545,86 @@ def syncSystemTime():
 # Config 
 #########
 
-# Load config value as array of integers
-def getConfigValue(valuestr):
+# Load config value as array of integers, [-1] for any (*)
+# Supports comma separated values, ranges (1-5) and steps (*/15, 0-30/10)
+# Returns an empty list if the value is invalid or outside minvalue-maxvalue
+def getConfigValue(valuestr, minvalue = 0, maxvalue = 59):
 	try:
 		if valuestr == "*":
 			return [-1]
-		tmplist = valuestr.split(",")
-		map_object = map(int, tmplist)
-		return list(map_object)
-	except:
-		return [-1]
+		result = []
+		for curitem in valuestr.split(","):
+			step = 1
+			tmppair = curitem.split("/")
+			if len(tmppair) == 2:
+				step = int(tmppair[1])
+				if step < 1:
+					return []
+			elif len(tmppair) > 2:
+				return []
+			tmprange = tmppair[0].split("-")
+			if len(tmprange) > 2:
+				return []
+			if tmprange[0] == "*" and len(tmprange) == 1:
+				startvalue = minvalue
+				endvalue = maxvalue
+			elif len(tmprange) == 2:
+				startvalue = int(tmprange[0])
+				endvalue = int(tmprange[1])
+			elif len(tmppair) == 2:
+				# 5/15 is 5-max/15
+				startvalue = int(tmprange[0])
+				endvalue = maxvalue
+			else:
+				startvalue = int(tmprange[0])
+				endvalue = startvalue
+			if startvalue < minvalue or endvalue > maxvalue or startvalue > endvalue:
+				return []
+			result = result + list(range(startvalue, endvalue+1, step))
+		return sorted(set(result))
+	except ValueError:
+		return []
+
+# Weekday values, Sunday can be 0 or 7
+def getConfigWeekdayValue(valuestr):
+	valuelist = getConfigValue(valuestr, 0, 7)
+	if 7 in valuelist:
+		valuelist = sorted(set([0 if curvalue == 7 else curvalue for curvalue in valuelist]))
+	return valuelist
+
+# Field name, min and max value
+RTC_SCHEDULEFIELDLIST = [["minute", 0, 59], ["hour", 0, 23], ["date", 1, 31], ["month", 1, 12], ["weekday", 0, 6]]
+
+# Bitmask with the bit of each value set, any (-1) sets all bits from minvalue to maxvalue
+def getConfigMask(valuelist, minvalue, maxvalue):
+	mask = 0
+	for curvalue in valuelist:
+		if curvalue < 0:
+			return ((1 << (maxvalue+1)) - 1) & ~((1 << minvalue) - 1)
+		mask = mask | (1 << curvalue)
+	return mask
+
+def isConfigMaskAny(mask, fieldname):
+	for fieldinfo in RTC_SCHEDULEFIELDLIST:
+		if fieldinfo[0] == fieldname:
+			return mask == getConfigMask([-1], fieldinfo[1], fieldinfo[2])
+	return False
 
-# Load config line data as array of Command schedule
+# Load config line data as Command schedule, in a list (empty if invalid)
+# Each field is stored as a bitmask, see getConfigMask
 def newCommandSchedule(curline):
-	result = []
 	linedata = curline.split(" ")
 	if len(linedata) < 6:
-		return result
+		return []
 
-	minutelist = getConfigValue(linedata[0])
-	hourlist = getConfigValue(linedata[1])
-	datelist = getConfigValue(linedata[2])
-	#monthlist = getConfigValue(linedata[3])
-	monthlist = [-1] # Certain edge cases will not be handled properly
-	weekdaylist = getConfigValue(linedata[4])
+	minutelist = getConfigValue(linedata[0], 0, 59)
+	hourlist = getConfigValue(linedata[1], 0, 23)
+	datelist = getConfigValue(linedata[2], 1, 31)
+	#monthlist = getConfigValue(linedata[3], 1, 12)
+	monthlist = [-1] # RTC alarm has no month, it would fire in the wrong month
+	weekdaylist = getConfigWeekdayValue(linedata[4])
+	if len(minutelist) == 0 or len(hourlist) == 0 or len(datelist) == 0 or len(weekdaylist) == 0:
+		return []
 
 	cmd = ""
 	ctr = 5
@@ -581,21 +633,21 @@ def newCommandSchedule(curline):
 		ctr = ctr + 1
 	cmd = cmd.strip()
 
-	for curmin in minutelist:
-		for curhour in hourlist:
-			for curdate in datelist:
-				for curmonth in monthlist:
-					for curweekday in weekdaylist:
-						result.append({ "minute": curmin, "hour": curhour, "date": curdate, "month":curmonth, "weekday": curweekday, "cmd":cmd })
-
-	return result
+	return [{
+		"minute": getConfigMask(minutelist, 0, 59),
+		"hour": getConfigMask(hourlist, 0, 23),
+		"date": getConfigMask(datelist, 1, 31),
+		"month": getConfigMask(monthlist, 1, 12),
+		"weekday": getConfigMask(weekdaylist, 0, 6),
+		"cmd": cmd
+	}]
 
 # Save updated config file
 def saveConfigList(fname, configlist):
 	f = open(fname, "w")
 	f.write("#\n")
 	f.write("# Argon RTC Configuration\n")
-	f.write("# - Follows cron general format, but with only * and csv support\n")
+	f.write("# - Follows cron general format, supports *, csv, ranges (1-5) and steps (*/15)\n")
 	f.write("# - Each row follows the following format:\n")
 	f.write("#      min hour date month dayOfWeek Command\n")
 	f.write("#      e.g. Shutdown daily at 1am\n")
@@ -644,12 +696,15 @@ def loadConfigList(fname):
 	except:
 		return []
 
-# Form Command Schedule list from config list 
+# Form Command Schedule list from config list, invalid lines are skipped
 def formCommandScheduleList(configlist):
 	try:
 		result = []
 		for config in configlist:
-			result = result + newCommandSchedule(config)
+			commandschedule = newCommandSchedule(config)
+			if len(commandschedule) == 0:
+				print("Invalid schedule skipped:", config, flush=True)
+			result = result + commandschedule
 		return result
 	except:
 		return []
@@ -660,12 +715,15 @@ def describeConfigListEntry(configlistitem):
 	if len(linedata) < 6:
 		return ""
 
-	minutelist = getConfigValue(linedata[0])
-	hourlist = getConfigValue(linedata[1])
-	datelist = getConfigValue(linedata[2])
-	#monthlist = getConfigValue(linedata[3])
+	minutelist = getConfigValue(linedata[0], 0, 59)
+	hourlist = getConfigValue(linedata[1], 0, 23)
+	datelist = getConfigValue(linedata[2], 1, 31)
+	#monthlist = getConfigValue(linedata[3], 1, 12)
 	monthlist = [-1] # Certain edge cases will not be handled properly
-	weekdaylist = getConfigValue(linedata[4])
+	weekdaylist = getConfigWeekdayValue(linedata[4])
+	if len(minutelist) == 0 or len(hourlist) == 0 or len(datelist) == 0 or len(weekdaylist) == 0:
+		# Still listed so it can be removed
+		return "Invalid | "+configlistitem
 
 	cmd = ""
 	ctr = 5
@@ -695,28 +753,9 @@ def describeConfigList(fname):
 
 # Check Command schedule if it should fire for the give time
 def checkDateForCommandSchedule(commandschedule, datetimeobj):
-	testminute = commandschedule.get("minute", -1)
-	testhour = commandschedule.get("hour", -1)
-	testdate = commandschedule.get("date", -1)
-	testmonth = commandschedule.get("month", -1)
-	testweekday = commandschedule.get("weekday", -1)
-
-	if testminute < 0 or testminute == datetimeobj.minute:
-		if testhour < 0 or testhour == datetimeobj.hour:
-			if testdate < 0 or testdate == datetimeobj.day:
-				if testmonth < 0 or testmonth == datetimeobj.month:
-					if testweekday < 0:
-						return True
-					else:
-						# python Sunday = 6, RTC Sunday = 0
-						weekDay = datetimeobj.weekday()
-						if weekDay == 6:
-							weekDay = 0
-						else:
-							weekDay = weekDay + 1
-						if testweekday == weekDay:
-							return True
-	return False
+	# python Sunday = 6, RTC Sunday = 0
+	weekDay = (datetimeobj.weekday() + 1) % 7
+	return ((commandschedule["minute"] >> datetimeobj.minute) & (commandschedule["hour"] >> datetimeobj.hour) & (commandschedule["date"] >> datetimeobj.day) & (commandschedule["month"] >> datetimeobj.month) & (commandschedule["weekday"] >> weekDay) & 1) == 1
 
 # Get current command
 def getCommandForTime(commandschedulelist, datetimeobj, checkcmd):
@@ -738,213 +777,233 @@ def getLastMonthDate(year, month):
 	testtime = testtime - datetime.timedelta(days=1)
 	return testtime.day
 
-# Increment to the next iteration of command schedule
-def incrementCommandScheduleTime(commandschedule, testtime, addmode):
-	testminute = commandschedule.get("minute", -1)
-	testhour = commandschedule.get("hour", -1)
-	testdate = commandschedule.get("date", -1)
-	testmonth = commandschedule.get("month", -1)
-	testweekday = commandschedule.get("weekday", -1)
-
-	if addmode == "minute":
-		testfield = commandschedule.get(addmode, -1)
-		if testfield < 0:
-			if testtime.minute < 59:
-				return testtime + datetime.timedelta(minutes=1)
-			else:
-				return incrementCommandScheduleTime(commandschedule, testtime.replace(minute=0), "hour")
-		else:
-			return incrementCommandScheduleTime(commandschedule, testtime, "hour")
-	elif addmode == "hour":
-		testfield = commandschedule.get(addmode, -1)
-		if testfield < 0:
-			if testtime.hour < 23:
-				return testtime + datetime.timedelta(hours=1)
-			else:
-				return incrementCommandScheduleTime(commandschedule, testtime.replace(hour=0), "date")
-		else:
-			return incrementCommandScheduleTime(commandschedule, testtime, "date")
-	elif addmode == "date":
-		testfield = commandschedule.get(addmode, -1)
-		if testfield < 0:
-			maxmonthdate = getLastMonthDate(testtime.year, testtime.month)
-			if testtime.day < maxmonthdate:
-				return testtime + datetime.timedelta(days=1)
-			else:
-				return incrementCommandScheduleTime(commandschedule, testtime.replace(day=1), "month")
-		else:
-			return incrementCommandScheduleTime(commandschedule, testtime, "month")
-	elif addmode == "month":
-		testfield = commandschedule.get(addmode, -1)
-		if testfield < 0:
-			nextmonth = testtime.month
-			nextyear = testtime.year
-			while True:
-				if nextmonth < 12:
-					nextmonth = nextmonth + 1
-				else:
-					nextmonth = 1
-					nextyear = nextyear + 1
-				maxmonthdate = getLastMonthDate(nextyear, nextmonth)
-				if testtime.day <= maxmonthdate:
-					return testtime.replace(month=nextmonth, year=nextyear)
-		else:
-			return incrementCommandScheduleTime(commandschedule, testtime, "year")
-	else:
-		# Year
-		if testtime.month == 2 and testtime.day == 29:
-			# Leap day handling
-			nextyear = testtime.year
-			while True:
-				nextyear = nextyear + 1
-				maxmonthdate = getLastMonthDate(nextyear, testtime.month)
-				if testtime.day <= maxmonthdate:
-					return testtime.replace(year=nextyear)
+# Lowest value >= startvalue in the mask, -1 if none
+def getNextMaskValue(mask, startvalue):
+	mask = mask >> startvalue
+	if mask == 0:
+		return -1
+	return startvalue + (mask & -mask).bit_length() - 1
+
+# Weekday has to be checked for one full leap year/weekday cycle, e.g. Feb 29 on a Monday
+RTC_SCHEDULELIMITYEARS = 28
+
+# Next time the command schedule fires after aftertime, None if it won't
+# Each month is checked once, the date, hour and minute are looked up in the masks
+def getNextCommandScheduleTime(commandschedule, aftertime):
+	minutemask = commandschedule["minute"]
+	hourmask = commandschedule["hour"]
+	datemask = commandschedule["date"]
+	monthmask = commandschedule["month"]
+	weekdaymask = commandschedule["weekday"]
+	if minutemask == 0 or hourmask == 0 or datemask == 0 or monthmask == 0 or weekdaymask == 0:
+		return None
+	testtime = aftertime.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+	year = testtime.year
+	month = testtime.month
+	startdate = testtime.day
+	monthctr = 0
+	while monthctr < RTC_SCHEDULELIMITYEARS*12:
+		if monthmask & (1 << month):
+			maxmonthdate = getLastMonthDate(year, month)
+			# RTC weekday of the 1st
+			firstweekday = (datetime.date(year, month, 1).weekday() + 1) % 7
+			date = getNextMaskValue(datemask, startdate)
+			while date > 0 and date <= maxmonthdate:
+				if weekdaymask & (1 << ((firstweekday + date - 1) % 7)):
+					starthour = 0
+					startminute = 0
+					if monthctr == 0 and date == testtime.day:
+						starthour = testtime.hour
+						startminute = testtime.minute
+					hour = getNextMaskValue(hourmask, starthour)
+					minute = getNextMaskValue(minutemask, 0)
+					if hour == starthour:
+						minute = getNextMaskValue(minutemask, startminute)
+						if minute < 0:
+							hour = getNextMaskValue(hourmask, starthour+1)
+							minute = getNextMaskValue(minutemask, 0)
+					if hour >= 0:
+						return datetime.datetime(year, month, date, hour, minute)
+				date = getNextMaskValue(datemask, date+1)
+		startdate = 1
+		monthctr = monthctr + 1
+		if month < 12:
+			month = month + 1
 		else:
-			return testtime.replace(year=(testtime.year+1))
-
-# Set Next Alarm on RTC
+			month = 1
+			year = year + 1
+	return None
+
+# Next time a command fires after aftertime, [commandschedule, time] or [None, None]
+def getNextCommandTime(commandschedulelist, aftertime, checkcmd):
+	nextcommandschedule = None
+	nextcommandtime = None
+	for curschedule in commandschedulelist:
+		if curschedule["cmd"].lower() != checkcmd:
+			continue
+		testtime = getNextCommandScheduleTime(curschedule, aftertime)
+		if testtime is not None and (nextcommandtime is None or testtime < nextcommandtime):
+			nextcommandschedule = curschedule
+			nextcommandtime = testtime
+	return [nextcommandschedule, nextcommandtime]
+
+# Set Next Alarm on RTC, returns the alarm time or None if there's no "on" schedule
 def setNextAlarm(commandschedulelist, prevdatetime):
 	curtime = datetime.datetime.now()
-	if prevdatetime > curtime:
+	if prevdatetime is not None and prevdatetime > curtime:
 		return prevdatetime
 
-	# Divisible by 4 for leap day
-	checklimityears = 12
-	foundnextcmd = False
-	nextcommandschedule = {}
-	# To be sure it's later than any schedule
-	nextcommandtime = curtime.replace(year=(curtime.year+checklimityears))
-
-	ctr = 0
-	while ctr < len(commandschedulelist):
-		testcmd = commandschedulelist[ctr].get("cmd", "").lower()
-		if testcmd == "on":
-			invaliddata = False
-			testminute = commandschedulelist[ctr].get("minute", -1)
-			testhour = commandschedulelist[ctr].get("hour", -1)
-			testdate = commandschedulelist[ctr].get("date", -1)
-			testmonth = commandschedulelist[ctr].get("month", -1)
-			testweekday = commandschedulelist[ctr].get("weekday", -1)
-
-			tmpminute = testminute
-			tmphour = testhour
-			tmpdate = testdate
-			tmpmonth = testmonth
-			tmpyear = curtime.year
-
-			if tmpminute < 0:
-				tmpminute = curtime.minute
-
-			if tmphour < 0:
-				tmphour = curtime.hour
-
-			if tmpdate < 0:
-				tmpdate = curtime.day
-
-			if tmpmonth < 0:
-				tmpmonth = curtime.month
-
-			maxmonthdate = getLastMonthDate(tmpyear, tmpmonth)
-			if tmpdate > maxmonthdate:
-				# Invalid month date
-				if testdate < 0:
-					tmpdate = maxmonthdate
-				else:
-					# Date is fixed
-					if testminute < 0:
-						tmpminute = 0
-					if testhour < 0:
-						tmphour = 0
-					if testmonth < 0 and testdate <= 31:
-						# Look for next valid month
-						while tmpdate > maxmonthdate:
-							if tmpmonth < 12:
-								tmpmonth = tmpmonth + 1
-							else:
-								tmpmonth = 1
-								tmpyear = tmpyear + 1
-							maxmonthdate = getLastMonthDate(tmpyear, tmpmonth)
-					elif tmpdate == 29 and tmpmonth == 2:
-						# Fixed to leap day
-						while tmpdate > maxmonthdate:
-							tmpyear = tmpyear + 1
-							maxmonthdate = getLastMonthDate(tmpyear, tmpmonth)
-					else:
-						invaliddata = True
-			if invaliddata == False:
-				try:
-					testtime = datetime.datetime(tmpyear, tmpmonth, tmpdate, tmphour, tmpminute)
-				except:
-					# Force time diff
-					testtime = curtime - datetime.timedelta(hours=1)
-				tmptimediff = (curtime - testtime).total_seconds()
-			else:
-				tmptimediff = 0
-
-			if testweekday >= 0:
-				# Day of Week check
-				# python Sunday = 6, RTC Sunday = 0
-				weekDay = testtime.weekday()
-				if weekDay == 6:
-					weekDay = 0
-				else:
-					weekDay = weekDay + 1
-
-
-				if weekDay != testweekday or tmptimediff > 0:
-					# Resulting 0-ed time will be <= the testtime
-					if testminute < 0:
-						testtime = testtime.replace(minute=0)
-					if testhour < 0:
-						testtime = testtime.replace(hour=0)
-
-					dayoffset = testweekday-weekDay
-					if dayoffset < 0:
-						dayoffset = dayoffset + 7
-					elif dayoffset == 0:
-						dayoffset = 7
-
-					testtime = testtime + datetime.timedelta(days=dayoffset)
-
-				# Just look for the next valid weekday; Can be optimized
-				while checkDateForCommandSchedule(commandschedulelist[ctr], testtime) == False and (testtime.year - curtime.year) < checklimityears:
-					testtime = testtime + datetime.timedelta(days=7)
-
-				if (testtime.year - curtime.year) >= checklimityears:
-					# Too many iterations, abort/ignore
-					tmptimediff = 0
-				else:
-					tmptimediff = (curtime - testtime).total_seconds()
-			if tmptimediff > 0:
-				# Find next iteration that's greater than the current time (Day of Week check already handled)
-				while tmptimediff >= 0:
-					testtime = incrementCommandScheduleTime(commandschedulelist[ctr], testtime, "minute")
-					tmptimediff = (curtime - testtime).total_seconds()
-
-			if nextcommandtime > testtime and tmptimediff < 0:
-				nextcommandschedule = commandschedulelist[ctr]
-				nextcommandtime = testtime
-				foundnextcmd = True
-
-
-		ctr = ctr + 1
-	if foundnextcmd == True:
-		# Schedule Alarm
-		if nextcommandschedule.get("weekday", -1) >=0 or nextcommandschedule.get("date", -1) > 0:
-			# Set alarm based on hour/minute of next occurrence to factor in timezone changes if any
-			setRTCAlarm(True, nextcommandschedule.get("weekday", -1), nextcommandschedule.get("date", -1), nextcommandtime.hour, nextcommandtime.minute)
-		else:
-			# no date,weekday involved just shift the hour and minute accordingly
-			setRTCAlarm(True, nextcommandschedule.get("weekday", -1), nextcommandschedule.get("date", -1), nextcommandschedule.get("hour", -1), nextcommandschedule.get("minute", -1))
+	nextcommandschedule, nextcommandtime = getNextCommandTime(commandschedulelist, curtime, "on")
+
+	if nextcommandschedule is not None:
+		# Schedule Alarm, the RTC takes one value per field so it's set to the next occurrence
+		# Fields that can be any value are left out, so the alarm repeats
+		weekday = -1
+		date = -1
+		hour = nextcommandtime.hour
+		minute = nextcommandtime.minute
+		if isConfigMaskAny(nextcommandschedule["weekday"], "weekday") == False:
+			weekday = (nextcommandtime.weekday() + 1) % 7
+		if isConfigMaskAny(nextcommandschedule["date"], "date") == False:
+			date = nextcommandtime.day
+		if weekday < 0 and date < 0:
+			# no date,weekday involved
+			if isConfigMaskAny(nextcommandschedule["hour"], "hour") == True:
+				hour = -1
+			if isConfigMaskAny(nextcommandschedule["minute"], "minute") == True:
+				minute = -1
+		setRTCAlarm(True, weekday, date, hour, minute)
 		return nextcommandtime
-	else:
-		removeRTCAlarm()
-	# This will ensure that this will be replaced next iteration
-	return curtime
+	removeRTCAlarm()
+	return None
+
+# Config file modification time, 0 if there's none
+def getConfigModifiedTime():
+	try:
+		return os.stat(RTC_CONFIGFILE).st_mtime
+	except OSError:
+		return 0
+
+# Longest wait of the service loop, the loop also checks the config file and
+# follows clock changes when it wakes up
+RTC_MAXWAITSEC = 3600
+# Difference between the wall clock and monotonic time since the last wake up that
+# counts as a clock change (NTP, date -s) instead of drift
+RTC_CLOCKCHANGESEC = 5
+
+# RTC Service loop
+# Yields the number of seconds to wait before the next iteration, so it can be
+# driven by its own sleep loop or by the shared timer in argononed.py
+# It wakes up on the minute of the next "off" command or RTC alarm, the RTC flags
+# are only cleared when the alarm has fired
+# An "off" command between two wake ups is due, unless the clock was changed, then
+# only the current minute is checked (e.g. NTP setting the time after a boot with an
+# unset RTC would otherwise go through every "off" since)
+# minutewakeflag wakes up on each minute, for timers that don't follow clock changes
+def rtcServiceLoop(minutewakeflag = False):
+	syncSystemTime()
+	configtime = getConfigModifiedTime()
+	commandschedulelist = formCommandScheduleList(loadConfigList(RTC_CONFIGFILE))
+	clearRTCAlarmFlag()
+	clearRTCTimerFlag()
+	nextrtcalarmtime = setNextAlarm(commandschedulelist, None)
+	# Includes the current minute on start
+	checkedtime = datetime.datetime.now() - datetime.timedelta(minutes=1)
+	checkedmonotonic = time.monotonic() - 60
+	while True:
+		tmpcurrenttime = datetime.datetime.now()
+		tmpmonotonic = time.monotonic()
+		clockchangeflag = abs((tmpcurrenttime - checkedtime).total_seconds() - (tmpmonotonic - checkedmonotonic)) > RTC_CLOCKCHANGESEC
+		tmpconfigtime = getConfigModifiedTime()
+		if tmpconfigtime != configtime:
+			# Config changed, reload and replace the RTC Alarm
+			configtime = tmpconfigtime
+			commandschedulelist = formCommandScheduleList(loadConfigList(RTC_CONFIGFILE))
+			nextrtcalarmtime = setNextAlarm(commandschedulelist, None)
+		elif nextrtcalarmtime is not None and nextrtcalarmtime <= tmpcurrenttime:
+			# Alarm fired, update RTC Alarm to next iteration
+			clearRTCAlarmFlag()
+			clearRTCTimerFlag()
+			nextrtcalarmtime = setNextAlarm(commandschedulelist, nextrtcalarmtime)
+		elif clockchangeflag == True:
+			# Next alarm may have moved
+			nextrtcalarmtime = setNextAlarm(commandschedulelist, None)
+
+		# Looked up on each wake up, from the last minute checked, or the current minute if
+		# the clock was changed
+		if clockchangeflag == True:
+			checkedtime = tmpcurrenttime - datetime.timedelta(minutes=1)
+		nextofftime = getNextCommandTime(commandschedulelist, checkedtime, "off")[1]
+		checkedtime = tmpcurrenttime
+		checkedmonotonic = tmpmonotonic
+		if nextofftime is not None and nextofftime <= tmpcurrenttime:
+			# Shutdown detected, issue command then end service loop
+			os.system("shutdown now -h")
+			# Don't break to sleep while command executes (prevents service to restart)
+			yield 60
+			return
+
+		waitsec = RTC_MAXWAITSEC
+		for nexteventtime in [nextofftime, nextrtcalarmtime]:
+			if nexteventtime is not None:
+				waitsec = min(waitsec, (nexteventtime - tmpcurrenttime).total_seconds())
+		if minutewakeflag == True:
+			nextminutetime = tmpcurrenttime.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+			waitsec = min(waitsec, (nextminutetime - tmpcurrenttime).total_seconds())
+		yield waitsec
+
+# Service loop for the shared timer in argononed.py, which runs on monotonic time
+# Wakes up each minute to follow clock and config changes, no I2C unless there's an event
+def rtcSharedServiceLoop():
+	return rtcServiceLoop(True)
+
+
+# Wall clock timer (timerfd) for the service loop, wakes up early if the clock is set
+# None if it's not available, e.g. no timerfd in the C library
+RTC_CLOCK_REALTIME = 0
+RTC_TFD_TIMER_ABSTIME = 1
+RTC_TFD_TIMER_CANCEL_ON_SET = 2
+RTC_TFD_CLOEXEC = 0o2000000
+
+class RTCTimespec(ctypes.Structure):
+	_fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+class RTCItimerspec(ctypes.Structure):
+	_fields_ = [("it_interval", RTCTimespec), ("it_value", RTCTimespec)]
+
+def createWakeTimer():
+	try:
+		libc = ctypes.CDLL(None, use_errno=True)
+		fd = libc.timerfd_create(RTC_CLOCK_REALTIME, RTC_TFD_CLOEXEC)
+	except (OSError, AttributeError):
+		return None
+	if fd < 0:
+		return None
+	return [libc, fd]
+
+# Sleeps until the wall clock time waitsec from now, or until the clock is set
+def waitWakeTimer(waketimer, waitsec):
+	if waketimer is None:
+		time.sleep(waitsec)
+		return
+	libc, fd = waketimer
+	waketime = time.time() + waitsec
+	timerspec = RTCItimerspec()
+	timerspec.it_value.tv_sec = int(waketime)
+	timerspec.it_value.tv_nsec = int((waketime - int(waketime))*1000000000)
+	if libc.timerfd_settime(fd, RTC_TFD_TIMER_ABSTIME | RTC_TFD_TIMER_CANCEL_ON_SET, ctypes.byref(timerspec), None) < 0:
+		time.sleep(waitsec)
+		return
+	try:
+		os.read(fd, 8)
+	except OSError as e:
+		# ECANCELED, clock was set
+		if e.errno != errno.ECANCELED:
+			raise
 
 ######
-if len(sys.argv) > 1:
+# Only handle commands when ran as script (argononed.py imports this for combined service)
+if __name__ == "__main__" and len(sys.argv) > 1:
 	cmd = sys.argv[1].upper()
 
 	# Enable Alarm/Timer Flags
@@ -986,26 +1045,9 @@ if len(sys.argv) > 1:
 				removeConfigEntry(RTC_CONFIGFILE, configidx)
 
 	elif cmd == "SERVICE":
-		syncSystemTime()
-		commandschedulelist = formCommandScheduleList(loadConfigList(RTC_CONFIGFILE))
-		nextrtcalarmtime = setNextAlarm(commandschedulelist, datetime.datetime.now())
-		serviceloop = True
-		while serviceloop==True:
-			clearRTCAlarmFlag()
-			clearRTCTimerFlag()
-
-			tmpcurrenttime = datetime.datetime.now()
-			if nextrtcalarmtime <= tmpcurrenttime:
-				# Update RTC Alarm to next iteration
-				nextrtcalarmtime = setNextAlarm(commandschedulelist, nextrtcalarmtime)
-			elif len(getCommandForTime(commandschedulelist, tmpcurrenttime, "off")) > 0:
-				# Shutdown detected, issue command then end service loop
-				os.system("shutdown now -h")
-				serviceloop = False
-				# Don't break to sleep while command executes (prevents service to restart)
-			
-
-			time.sleep(60)
+		waketimer = createWakeTimer()
+		for waitsec in rtcServiceLoop():
+			waitWakeTimer(waketimer, waitsec)
 
 
 elif False:
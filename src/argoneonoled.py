@@ -7,16 +7,20 @@ import math
 
 import os
 import time
+import zlib
+import struct
+import hashlib
+from collections import OrderedDict
 
-# Initialize I2C Bus
-import smbus
-import RPi.GPIO as GPIO
+# Optional, used for faster image conversion
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
-rev = GPIO.RPI_REVISION
-if rev == 2 or rev == 3:
-	bus=smbus.SMBus(1)
-else:
-	bus=smbus.SMBus(0)
+# Shared I2C Bus
+sys.path.append("/etc/argon/")
+from argonbus import *
 
 
 OLED_WD=128
@@ -26,8 +30,248 @@ ADDR_OLED=0x3c
 
 OLED_NUMFONTCHAR=256
 
+# Font and background files
+OLED_ASSETPATH="/etc/argon/oled/"
+OLED_ASSETCACHESIZE=16
+# filename: [mtime, bytes], most recently used last
+oled_assetcache = OrderedDict()
+
+# Rendered text, see oled_cachedwritetext
+OLED_TEXTCACHESIZE=64
+# (text, charht, charwd, y&7): [fontbytes, column count, [[page bytes, page mask], ...]]
+oled_textcache = OrderedDict()
+oled_textcachestats = {"hits": 0, "misses": 0}
+
+# Byte translation tables to shift each byte by 0-7 bits
+OLED_SHIFTLEFTTABLE = [bytes([(value<<shift)&0xFF for value in range(256)]) for shift in range(8)]
+OLED_SHIFTRIGHTTABLE = [bytes([value>>shift for value in range(256)]) for shift in range(8)]
+
+# Converted images from oled_loadimage, keyed by source hash
+OLED_IMAGECACHEPATH="/var/cache/argon/oled/"
+
 OLED_BUFFERIZE = ((OLED_WD*OLED_HT)>>3)
-oled_imagebuffer = [0] * OLED_BUFFERIZE
+# Framebuffer, one byte per 8 vertical pixels (SSD1306 page format)
+oled_imagebuffer = bytearray(OLED_BUFFERIZE)
+# Zero-copy view for flushing blocks
+oled_imagebufferview = memoryview(oled_imagebuffer)
+
+# Double buffering: oled_imagebuffer is the back buffer that pages draw into,
+# oled_sentbuffer is a copy of the front buffer (what's on the panel)
+# Last frame sent to the panel, used to flush only the changed blocks
+oled_sentbuffer = bytearray(OLED_BUFFERIZE)
+oled_sentbufferview = memoryview(oled_sentbuffer)
+# Panel contents unknown until the first full flush
+oled_sentbuffervalid = False
+
+OLED_FLUSHBLOCKSIZE = 32
+# Display data is sent a page at a time
+OLED_RAWBLOCKSIZE = OLED_WD
+
+OLED_BLACKBUFFER = bytes(OLED_BUFFERIZE)
+OLED_WHITEBUFFER = b"\xff" * OLED_BUFFERIZE
+
+
+##################
+# Display Backends
+##################
+#
+# All panel output goes through the active backend, which receives SSD1306
+# command bytes and display data:
+#   command(cmdlist)    - list of command bytes
+#   data(databytes)     - display data, written at the current GDDRAM address
+#   endframe()          - called after each oled_flushimage
+#
+
+# SSD1306 over I2C through argonbus (default)
+class OledPanelBackend:
+	def __init__(self):
+		# Raw I2C writes disabled if the adapter doesn't support them
+		self.rawwriteenabled = True
+
+	def command(self, cmdlist):
+		argonbus_writecommands(ADDR_OLED, 0, cmdlist, ARGONBUS_PRIORITY_OLED)
+
+	# Sends display data as one raw I2C write when possible, otherwise as 32 byte
+	# SMBus block writes (from then on if the adapter doesn't support raw writes)
+	# Not retried here, the panel address has moved after a failed write, see oled_flushwindow
+	def data(self, databytes):
+		if self.rawwriteenabled == True and len(databytes) > OLED_FLUSHBLOCKSIZE:
+			try:
+				argonbus_writerawblockdata(ADDR_OLED, OLED_SLAVEADDRESS, databytes, ARGONBUS_PRIORITY_OLED, 0)
+				return
+			except IOError as e:
+				if argonbus_isunsupported(e) == False:
+					raise
+				self.rawwriteenabled = False
+
+		idx = 0
+		while idx < len(databytes):
+			argonbus_writeblockdata(ADDR_OLED, OLED_SLAVEADDRESS, databytes[idx:(idx+OLED_FLUSHBLOCKSIZE)], ARGONBUS_PRIORITY_OLED, 0)
+			idx = idx + OLED_FLUSHBLOCKSIZE
+
+	def endframe(self):
+		return
+
+# Number of argument bytes that follow SSD1306 commands
+OLED_COMMANDARGCOUNT = {0x20: 1, 0x21: 2, 0x22: 2, 0x26: 6, 0x27: 6, 0x29: 5, 0x2A: 5, 0x81: 1, 0x8D: 1, 0xA3: 2, 0xA8: 1, 0xD3: 1, 0xD5: 1, 0xD9: 1, 0xDA: 1, 0xDB: 1}
+
+# Emulates the panel memory (GDDRAM), counts transactions and bytes
+class OledMemoryBackend:
+	def __init__(self):
+		self.gddram = bytearray(OLED_BUFFERIZE)
+		self.poweron = False
+		self.addressmode = 2
+		self.colstart = 0
+		self.colend = OLED_WD-1
+		self.pagestart = 0
+		self.pageend = (OLED_HT>>3)-1
+		self.col = 0
+		self.page = 0
+		self.pendingcmd = []
+		self.resetcounters()
+
+	def resetcounters(self):
+		self.transactions = 0
+		self.bytecount = 0
+		self.frames = 0
+
+	def command(self, cmdlist):
+		self.transactions = self.transactions + 1
+		self.bytecount = self.bytecount + 1 + len(cmdlist)
+		for curcmd in cmdlist:
+			self.pendingcmd.append(curcmd)
+			if len(self.pendingcmd) > OLED_COMMANDARGCOUNT.get(self.pendingcmd[0], 0):
+				self.runcommand(self.pendingcmd)
+				self.pendingcmd = []
+
+	def runcommand(self, cmd):
+		if cmd[0] == 0x20:
+			self.addressmode = cmd[1] & 3
+		elif cmd[0] == 0x21:
+			self.colstart = cmd[1] & 0x7F
+			self.colend = cmd[2] & 0x7F
+			self.col = self.colstart
+		elif cmd[0] == 0x22:
+			self.pagestart = cmd[1] & 7
+			self.pageend = cmd[2] & 7
+			self.page = self.pagestart
+		elif cmd[0] == 0xAE or cmd[0] == 0xAF:
+			self.poweron = cmd[0] == 0xAF
+		elif cmd[0] >= 0xB0 and cmd[0] <= 0xB7:
+			self.page = cmd[0] & 7
+		elif cmd[0] <= 0x0F:
+			self.col = (self.col & 0xF0) | cmd[0]
+		elif cmd[0] <= 0x1F:
+			self.col = (self.col & 0x0F) | ((cmd[0] & 0xF) << 4)
+
+	def data(self, databytes):
+		self.transactions = self.transactions + 1
+		self.bytecount = self.bytecount + 1 + len(databytes)
+		idx = 0
+		while self.addressmode == 0 and idx < len(databytes):
+			# Horizontal, copy up to the end of the column range at a time
+			count = self.colend + 1 - self.col
+			if count < 1:
+				count = 1
+			if count > len(databytes) - idx:
+				count = len(databytes) - idx
+			bufferoffset = OLED_WD*self.page + self.col
+			self.gddram[bufferoffset:(bufferoffset+count)] = databytes[idx:(idx+count)]
+			idx = idx + count
+			self.col = self.col + count
+			if self.col > self.colend:
+				self.col = self.colstart
+				self.page = self.page + 1
+				if self.page > self.pageend:
+					self.page = self.pagestart
+
+		for curbyte in databytes[idx:]:
+			self.gddram[OLED_WD*self.page + self.col] = curbyte
+			if self.addressmode == 1:
+				# Vertical
+				self.page = self.page + 1
+				if self.page > self.pageend:
+					self.page = self.pagestart
+					self.col = self.col + 1
+					if self.col > self.colend:
+						self.col = self.colstart
+			elif self.col < OLED_WD-1:
+				# Page
+				self.col = self.col + 1
+
+	def endframe(self):
+		self.frames = self.frames + 1
+
+	def getframe(self):
+		return bytes(self.gddram)
+
+	# Frame as rows of 0/1 pixel values
+	def getpixelrows(self):
+		output = []
+		y = 0
+		while y < OLED_HT:
+			bufferoffset = OLED_WD*(y>>3)
+			ybit = 1<<(y&0x7)
+			output.append([1 if (self.gddram[bufferoffset+x] & ybit) else 0 for x in range(OLED_WD)])
+			y = y + 1
+		return output
+
+# Writes each frame to a PBM or PNG file (by extension)
+# Filename can contain {} to number the frames, otherwise it's overwritten
+class OledFileBackend(OledMemoryBackend):
+	def __init__(self, filename):
+		OledMemoryBackend.__init__(self)
+		self.filename = filename
+
+	def endframe(self):
+		OledMemoryBackend.endframe(self)
+		fname = self.filename.replace("{}", str(self.frames))
+		if fname.lower().endswith(".png"):
+			oled_savepng(fname, self.getpixelrows())
+		else:
+			oled_savepbm(fname, self.getpixelrows())
+
+def oled_savepbm(fname, pixelrows):
+	# Binary PBM, 1 is black so lit pixels are saved as 0
+	rowbytes = (OLED_WD+7)>>3
+	with open(fname, "wb") as fp:
+		fp.write(("P4\n"+str(OLED_WD)+" "+str(OLED_HT)+"\n").encode())
+		for currow in pixelrows:
+			packed = bytearray(rowbytes)
+			x = 0
+			while x < OLED_WD:
+				if currow[x] == 0:
+					packed[x>>3] = packed[x>>3] | (0x80>>(x&0x7))
+				x = x + 1
+			fp.write(packed)
+
+def oled_savepng(fname, pixelrows):
+	# 8-bit grayscale, lit pixels are white
+	rawdata = bytearray()
+	for currow in pixelrows:
+		rawdata.append(0)
+		rawdata.extend([255 if curpixel else 0 for curpixel in currow])
+
+	def pngchunk(chunktype, chunkdata):
+		return struct.pack(">I", len(chunkdata)) + chunktype + chunkdata + struct.pack(">I", zlib.crc32(chunktype+chunkdata))
+
+	with open(fname, "wb") as fp:
+		fp.write(b"\x89PNG\r\n\x1a\n")
+		fp.write(pngchunk(b"IHDR", struct.pack(">IIBBBBB", OLED_WD, OLED_HT, 8, 0, 0, 0, 0)))
+		fp.write(pngchunk(b"IDAT", zlib.compress(bytes(rawdata))))
+		fp.write(pngchunk(b"IEND", b""))
+
+oled_backend = OledPanelBackend()
+
+def oled_getbackend():
+	return oled_backend
+
+# Panel contents and power state are unknown for the new backend
+def oled_setbackend(backend):
+	global oled_backend, oled_sentbuffervalid, oled_powerstate
+	oled_backend = backend
+	oled_sentbuffervalid = False
+	oled_powerstate = None
 
 
 def oled_getmaxY():
@@ -36,6 +280,26 @@ def oled_getmaxY():
 def oled_getmaxX():
 	return OLED_WD
 
+# Returns file contents, reloaded only when the file's mtime changes
+# Raises FileNotFoundError if missing
+def oled_loadasset(fname):
+	fname = OLED_ASSETPATH+fname
+	mtime = os.stat(fname).st_mtime_ns
+	cacheitem = oled_assetcache.get(fname)
+	if cacheitem is not None and cacheitem[0] == mtime:
+		oled_assetcache.move_to_end(fname)
+		return cacheitem[1]
+
+	file = open(fname, "rb")
+	filebytes = file.read()
+	file.close()
+
+	oled_assetcache[fname] = [mtime, filebytes]
+	oled_assetcache.move_to_end(fname)
+	while len(oled_assetcache) > OLED_ASSETCACHESIZE:
+		oled_assetcache.popitem(last=False)
+	return filebytes
+
 def oled_loadbg(bgname):
 	if bgname == "bgblack":
 		oled_clearbuffer()
@@ -44,31 +308,115 @@ def oled_loadbg(bgname):
 		oled_clearbuffer(1)
 		return
 	try:
-		file = open("/etc/argon/oled/"+bgname+".bin", "rb")
-		bgbytes = list(file.read())
-		file.close()
+		bgbytes = oled_loadasset(bgname+".bin")
 		ctr = len(bgbytes)
-		if ctr == OLED_BUFFERIZE:
-			oled_imagebuffer[:] = bgbytes
-		elif ctr > OLED_BUFFERIZE:
+		if ctr >= OLED_BUFFERIZE:
 			oled_imagebuffer[:] = bgbytes[0:OLED_BUFFERIZE]
 		else:
 			oled_imagebuffer[0:ctr] = bgbytes
 			# Clear the rest of the buffer
-			while ctr < OLED_BUFFERIZE:
-				oled_imagebuffer[ctr] = 0
-				ctr=ctr+1
+			oled_imagebuffer[ctr:] = OLED_BLACKBUFFER[ctr:]
 	except FileNotFoundError:
 		oled_clearbuffer()
 
 
+# Loads an image file path or PIL image into the buffer, scaled to fit and centered
+# Pixels brighter than threshold are lit, or dithered (Floyd-Steinberg) if dither is set
+# Returns False if the image can't be loaded
+def oled_loadimage(image, dither = False, threshold = 128):
+	cachefname = ""
+	try:
+		if isinstance(image, str):
+			with open(image, "rb") as fp:
+				sourcehash = hashlib.sha1(fp.read())
+		else:
+			sourcehash = hashlib.sha1((image.mode+str(image.size)).encode())
+			sourcehash.update(image.tobytes())
+		sourcehash.update(("|"+str(dither)+"|"+str(threshold)).encode())
+		cachefname = OLED_IMAGECACHEPATH+sourcehash.hexdigest()+".bin"
+
+		with open(cachefname, "rb") as fp:
+			framebytes = fp.read()
+		if len(framebytes) == OLED_BUFFERIZE:
+			oled_imagebuffer[:] = framebytes
+			return True
+	except IOError:
+		if len(cachefname) == 0:
+			return False
+
+	try:
+		framebytes = oled_convertimage(image, dither, threshold)
+	except (IOError, ValueError):
+		return False
+	oled_imagebuffer[:] = framebytes
+
+	try:
+		os.makedirs(OLED_IMAGECACHEPATH, exist_ok=True)
+		with open(cachefname, "wb") as fp:
+			fp.write(framebytes)
+	except IOError:
+		# Cache is optional
+		pass
+	return True
+
+# Converts image to framebuffer bytes (SSD1306 page format)
+def oled_convertimage(image, dither = False, threshold = 128):
+	from PIL import Image
+
+	if isinstance(image, str):
+		image = Image.open(image)
+		image.load()
+	imgdata = image.convert("L")
+
+	# Rescale image to fit screen
+	imgwd, imght = imgdata.size
+	scalefactor = min(OLED_WD/imgwd, OLED_HT/imght)
+	imgwd = max(1, int(imgwd*scalefactor))
+	imght = max(1, int(imght*scalefactor))
+	imgdata = imgdata.resize((imgwd, imght), Image.LANCZOS)
+
+	# Center image
+	canvas = Image.new("L", (OLED_WD, OLED_HT), 0)
+	canvas.paste(imgdata, ((OLED_WD-imgwd)>>1, (OLED_HT-imght)>>1))
+
+	if dither == True:
+		monodata = canvas.convert("1", dither=Image.FLOYDSTEINBERG)
+	else:
+		monodata = canvas.point(lambda value: 255 if value >= threshold else 0).convert("1", dither=Image.NONE)
+
+	if numpy is not None:
+		# Rows of pixels to 8 pages x 8 rows x 128 columns, packed per column with the top row as LSB
+		pixels = numpy.unpackbits(numpy.frombuffer(monodata.tobytes(), dtype=numpy.uint8)).reshape(OLED_HT>>3, 8, OLED_WD)
+		return numpy.packbits(pixels.transpose(0, 2, 1), axis=2, bitorder="little").tobytes()
+
+	# Flipped and transposed, each row is a column from the bottom, 1 byte per page (bottom page first)
+	# with the MSB being the page's bottom row
+	columndata = monodata.transpose(Image.FLIP_TOP_BOTTOM).transpose(Image.TRANSPOSE).tobytes()
+	numpage = OLED_HT>>3
+	framebytes = bytearray(OLED_BUFFERIZE)
+	page = 0
+	while page < numpage:
+		framebytes[(OLED_WD*page):(OLED_WD*(page+1))] = columndata[(numpage-1-page)::numpage]
+		page = page + 1
+	return bytes(framebytes)
+
 def oled_clearbuffer(value = 0):
 	if value != 0:
-		value = 0xff
-	ctr = 0
-	while ctr < OLED_BUFFERIZE:
-		oled_imagebuffer[ctr] = value
-		ctr=ctr+1
+		oled_imagebuffer[:] = OLED_WHITEBUFFER
+	else:
+		oled_imagebuffer[:] = OLED_BLACKBUFFER
+
+# Returns a copy of the framebuffer, e.g. to restore parts of it later with oled_copyregion
+def oled_getbuffer():
+	return bytes(oled_imagebuffer)
+
+def oled_setbuffer(bufferbytes):
+	oled_imagebuffer[:] = bufferbytes[0:OLED_BUFFERIZE]
+
+# Returns a zero-copy view of the framebuffer bytes for the given page/column range
+def oled_getbufferblock(xoffset, yoffset, length):
+	bufferoffset = OLED_WD*(yoffset>>3) + xoffset
+	return oled_imagebufferview[bufferoffset:(bufferoffset+length)]
 
 def oled_writebyterow(x,y,bytevalue, mode = 0):
 	bufferoffset = OLED_WD*(y>>3) + x
@@ -104,86 +452,214 @@ def oled_fill(value):
 	oled_clearbuffer(value)
 	oled_flushimage()
 
-def oled_flushimage(hidescreen = True):
+# Only blocks that changed since the last flush are sent, unless forcefull is set
+def oled_flushimage(hidescreen = True, forcefull = False):
+	global oled_sentbuffervalid
+	if oled_sentbuffervalid == False:
+		forcefull = True
+
 	if hidescreen == True:
 		# Reset/Hide screen
 		oled_power(False)
 
-	xctr = 0
-	while xctr < OLED_WD:
-		yctr = 0
-		while yctr < OLED_HT:
-			oled_flushblock(xctr, yctr)
-			yctr = yctr + 8
-		xctr = xctr + 32
+	allsent = True
+	for curwindow in oled_getdirtywindows(forcefull):
+		if oled_flushwindow(curwindow[0], curwindow[1], curwindow[2], curwindow[3]) == False:
+			allsent = False
+	if allsent == False:
+		# Panel contents uncertain, resend everything next time
+		oled_sentbuffervalid = False
+	elif forcefull == True:
+		oled_sentbuffervalid = True
 
 	if hidescreen == True:
 		# Display
 		oled_power(True)
 
-
+	oled_backend.endframe()
+
+
+# Shows the back buffer without blanking the panel, only the changed blocks are sent
+# (the panel has no second frame memory, so changes are written in place)
+def oled_swapbuffers(forcefull = False):
+	oled_flushimage(False, forcefull)
+
+# Compares block with the last frame sent to the panel
+def oled_isblockdirty(xoffset, yoffset):
+	bufferoffset = OLED_WD*(yoffset>>3) + xoffset
+	return oled_getbufferblock(xoffset, yoffset, OLED_FLUSHBLOCKSIZE) != oled_sentbufferview[bufferoffset:(bufferoffset+OLED_FLUSHBLOCKSIZE)]
+
+# Groups blocks to be sent into addressing windows [xstart, xend, pagestart, pageend]
+# Adjacent blocks in a page share a window, consecutive full width pages are merged
+def oled_getdirtywindows(forcefull = False):
+	windowlist = []
+	page = 0
+	while page < (OLED_HT>>3):
+		runstart = -1
+		xctr = 0
+		while xctr <= OLED_WD:
+			if xctr < OLED_WD and (forcefull == True or oled_isblockdirty(xctr, page<<3) == True):
+				if runstart < 0:
+					runstart = xctr
+			elif runstart >= 0:
+				if runstart == 0 and xctr == OLED_WD and len(windowlist) > 0 and windowlist[-1][0] == 0 and windowlist[-1][1] == OLED_WD-1 and windowlist[-1][3] == page-1:
+					windowlist[-1][3] = page
+				else:
+					windowlist.append([runstart, xctr-1, page, page])
+				runstart = -1
+			xctr = xctr + OLED_FLUSHBLOCKSIZE
+		page = page + 1
+	return windowlist
+
+# Sets the addressing window with one command transaction, then writes the window data
+# Window data is contiguous in the buffer since it's either one page or full width
+# A failed window is sent again from the addressing, the panel address has moved
+# after a failed write. Returns False if not sent
+def oled_flushwindow(xstart, xend, pagestart, pageend):
+	attempt = 0
+	retrydelay = ARGONBUS_RETRYDELAY
+	while True:
+		try:
+			# Horizontal Addressing, Column range, Row (page) range, Display Start Line
+			oled_backend.command([0x20, 0x0, 0x21, xstart, xend, 0x22, pagestart, pageend, 0x40])
+
+			bufferoffset = OLED_WD*pagestart + xstart
+			bufferend = OLED_WD*pageend + xend + 1
+			while bufferoffset < bufferend:
+				blockend = bufferoffset + OLED_RAWBLOCKSIZE
+				if blockend > bufferend:
+					blockend = bufferend
+				# Write Out Buffer
+				oled_backend.data(oled_imagebufferview[bufferoffset:blockend])
+				oled_sentbuffer[bufferoffset:blockend] = oled_imagebufferview[bufferoffset:blockend]
+				bufferoffset = blockend
+			return True
+		except IOError:
+			if attempt >= ARGONBUS_RETRYCOUNT:
+				return False
+		except:
+			return False
+		time.sleep(retrydelay)
+		retrydelay = retrydelay*2
+		attempt = attempt + 1
+
+# Returns False if the block was not sent
 def oled_flushblock(xoffset, yoffset):
-	yoffset = yoffset>>3
-	blocksize = 32
-	try:
-		# Set COM-H Addressing
-		bus.write_byte_data(ADDR_OLED, 0, 0x20)
-		bus.write_byte_data(ADDR_OLED, 0, 0x1)
-
-		# Set Column range
-		bus.write_byte_data(ADDR_OLED, 0, 0x21)
-		bus.write_byte_data(ADDR_OLED, 0, xoffset)
-		bus.write_byte_data(ADDR_OLED, 0, xoffset+blocksize-1)
-
-		# Set Row Range
-		bus.write_byte_data(ADDR_OLED, 0, 0x22)
-		bus.write_byte_data(ADDR_OLED, 0, yoffset)
-		bus.write_byte_data(ADDR_OLED, 0, yoffset)
-
-		# Set Display Start Line
-		bus.write_byte_data(ADDR_OLED, 0, 0x40)
-
-		bufferoffset = OLED_WD*yoffset + xoffset
-		# Write Out Buffer
-		bus.write_i2c_block_data(ADDR_OLED, OLED_SLAVEADDRESS, oled_imagebuffer[bufferoffset:(bufferoffset+blocksize)])
-	except:
+	return oled_flushwindow(xoffset, xoffset+OLED_FLUSHBLOCKSIZE-1, yoffset>>3, yoffset>>3)
+
+# Applies bytemask to count bytes of a page at once
+# Mode 1 is XOR, otherwise masked pixels are lit
+def oled_writemaskedspan(bufferoffset, count, bytemask, mode = 0):
+	if count <= 0 or bytemask == 0:
+		return
+	spanend = bufferoffset + count
+	if bytemask == 0xFF and mode != 1:
+		oled_imagebuffer[bufferoffset:spanend] = OLED_WHITEBUFFER[0:count]
 		return
+	# Whole span as one integer, so the mask is applied in a single operation
+	spanvalue = int.from_bytes(oled_imagebuffer[bufferoffset:spanend], "little")
+	maskvalue = int.from_bytes(bytes((bytemask,))*count, "little")
+	if mode == 1:
+		spanvalue = spanvalue ^ maskvalue
+	else:
+		spanvalue = spanvalue | maskvalue
+	oled_imagebuffer[bufferoffset:spanend] = spanvalue.to_bytes(count, "little")
 
+# Only pixels inside the rectangle are changed, clipped to the screen
 def oled_drawfilledrectangle(x, y, wd, ht, mode = 0):
+	xmax = x + wd
 	ymax = y + ht
-	cury = y&0xF8
-
+	if x < 0:
+		x = 0
+	if y < 0:
+		y = 0
+	if xmax > OLED_WD:
+		xmax = OLED_WD
+	if ymax > OLED_HT:
+		ymax = OLED_HT
+
+	# One row span per page
+	cury = y
+	while cury < ymax and x < xmax:
+		page = cury>>3
+		pageend = (page+1)<<3
+		if pageend > ymax:
+			pageend = ymax
+		bytemask = (0xFF<<(cury&0x7)) & (0xFF>>(((page+1)<<3)-pageend)) & 0xFF
+		oled_writemaskedspan(OLED_WD*page + x, xmax-x, bytemask, mode)
+		cury = pageend
+
+# Copies the pixels inside the rectangle from srcbuffer (see oled_getbuffer), clipped to the screen
+def oled_copyregion(srcbuffer, x, y, wd, ht):
 	xmax = x + wd
-	curx = x
-	if ((y & 0x7)) != 0:
-		yshift = y&0x7
-		bytevalue = (0xFF<<yshift)&0xFF
-
-		# If 8 no additional masking needed
-		if ymax-cury  < 8:
-			yshift = 8-((ymax-cury)&0x7)
-			bytevalue = bytevalue & (0xFF>>yshift)
-
-		while curx < xmax:
-			oled_writebyterow(curx,cury,bytevalue, mode)
-			curx = curx + 1
-		cury = cury + 8
-	# Draw 8 rows at a time when possible
-	while cury + 8 < ymax:
-		curx = x
-		while curx < xmax:
-			oled_writebyterow(curx,cury,0xFF, mode)
-			curx = curx + 1
-		cury = cury + 8
-
-	if cury < ymax:
-		yshift = 8-((ymax-cury)&0x7)
-		bytevalue = (0xFF>>yshift)
-
-		curx = x
-		while curx < xmax:
-			oled_writebyterow(curx,cury,bytevalue, mode)
-			curx = curx + 1
+	ymax = y + ht
+	if x < 0:
+		x = 0
+	if y < 0:
+		y = 0
+	if xmax > OLED_WD:
+		xmax = OLED_WD
+	if ymax > OLED_HT:
+		ymax = OLED_HT
+
+	cury = y
+	while cury < ymax and x < xmax:
+		page = cury>>3
+		pageend = (page+1)<<3
+		if pageend > ymax:
+			pageend = ymax
+		bytemask = (0xFF<<(cury&0x7)) & (0xFF>>(((page+1)<<3)-pageend)) & 0xFF
+		bufferoffset = OLED_WD*page + x
+		spanend = bufferoffset + xmax - x
+		if bytemask == 0xFF:
+			oled_imagebuffer[bufferoffset:spanend] = srcbuffer[bufferoffset:spanend]
+		else:
+			maskvalue = int.from_bytes(bytes((bytemask,))*(xmax-x), "little")
+			spanvalue = int.from_bytes(oled_imagebuffer[bufferoffset:spanend], "little") & (maskvalue ^ ((1<<((xmax-x)<<3))-1))
+			spanvalue = spanvalue | (int.from_bytes(srcbuffer[bufferoffset:spanend], "little") & maskvalue)
+			oled_imagebuffer[bufferoffset:spanend] = spanvalue.to_bytes(xmax-x, "little")
+		cury = pageend
+
+# Moves the pixels inside the rectangle count columns to the left
+# The rightmost count columns are left as is
+def oled_scrollregionleft(x, y, wd, ht, count):
+	if x + wd > OLED_WD:
+		wd = OLED_WD - x
+	if count <= 0 or count >= wd:
+		return
+	oled_copyregion(bytes(oled_imagebuffer[count:]) + bytes(count), x, y, wd-count, ht)
+
+def oled_drawhorizontalline(x, y, wd, mode = 0):
+	oled_drawfilledrectangle(x, y, wd, 1, mode)
+
+def oled_drawverticalline(x, y, ht, mode = 0):
+	oled_drawfilledrectangle(x, y, 1, ht, mode)
+
+def oled_drawrectangle(x, y, wd, ht, mode = 0):
+	if wd <= 0 or ht <= 0:
+		return
+	oled_drawhorizontalline(x, y, wd, mode)
+	if ht > 1:
+		oled_drawhorizontalline(x, y+ht-1, wd, mode)
+	# Sides exclude corners so XOR mode doesn't draw them twice
+	if ht > 2:
+		oled_drawverticalline(x, y+1, ht-2, mode)
+		if wd > 1:
+			oled_drawverticalline(x+wd-1, y+1, ht-2, mode)
+
+# Bar filled in proportion to value/maxvalue, left to right or bottom to top if vertical
+def oled_drawbargraph(x, y, wd, ht, value, maxvalue = 100, mode = 0, vertical = False):
+	if maxvalue <= 0:
+		return
+	if value > maxvalue:
+		value = maxvalue
+	elif value < 0:
+		value = 0
+	if vertical == True:
+		barht = int(ht*value/maxvalue)
+		oled_drawfilledrectangle(x, y+ht-barht, wd, barht, mode)
+	else:
+		oled_drawfilledrectangle(x, y, int(wd*value/maxvalue), ht, mode)
 
 
 def oled_writetextaligned(textdata, x, y, boxwidth, alignmode, charwd = 6, mode = 0):
@@ -198,85 +674,145 @@ def oled_writetextaligned(textdata, x, y, boxwidth, alignmode, charwd = 6, mode
 	oled_writetext(textdata, x+leftoffset, y, charwd, mode)
 	
 
-def oled_writetext(textdata, x, y, charwd = 6, mode = 0):
+# Font height for the char width, rounded up to whole pages
+def oled_getcharheight(charwd):
 	if charwd < 6:
 		charwd = 6
-
 	charht = int((charwd<<3)/6)
 	if charht & 0x7:
 		charht = (charht&0xF8) + 8
+	return charht
+
+def oled_writetext(textdata, x, y, charwd = 6, mode = 0):
+	oled_writetextwindow(textdata, x, y, 0, None, charwd, mode)
+
+# Writes columns colstart to colend (None for all) of the text, x is where the text starts
+# Used to show part of a text that's wider than its area, e.g. for scrolling
+def oled_writetextwindow(textdata, x, y, colstart, colend, charwd = 6, mode = 0):
+	if charwd < 6:
+		charwd = 6
+
+	charht = oled_getcharheight(charwd)
 
 	try:
-		file = open("/etc/argon/oled/font"+str(charht)+"x"+str(charwd)+".bin", "rb")
-		fontbytes = list(file.read())
-		file.close()
+		fontbytes = oled_loadasset("font"+str(charht)+"x"+str(charwd)+".bin")
 	except FileNotFoundError:
 		try:
 			# Default to smallest
-			file = open("/etc/argon/oled/font8x6.bin", "rb")
-			fontbytes = list(file.read())
-			file.close()
+			fontbytes = oled_loadasset("font8x6.bin")
 		except FileNotFoundError:
 			return
 
-	if ((y & 0x7)) == 0:
-		# Use optimized loading
-		oled_fastwritetext(textdata, x, y, charht, charwd, fontbytes, mode)
+	oled_cachedwritetext(textdata, x, y, charht, charwd, fontbytes, mode, colstart, colend)
+
+# Text is rendered once per (text, font, y&7) into packed page bytes,
+# a repeat draw is then a slice copy (or one masked operation) per page
+def oled_cachedwritetext(textdata, x, y, charht, charwd, fontbytes, mode = 0, colstart = 0, colend = None):
+	cachekey = (textdata, charht, charwd, y&0x7)
+	cacheitem = oled_textcache.get(cachekey)
+	# Font file could have been reloaded
+	if cacheitem is not None and cacheitem[0] is fontbytes:
+		oled_textcachestats["hits"] = oled_textcachestats["hits"] + 1
+		oled_textcache.move_to_end(cachekey)
+	else:
+		oled_textcachestats["misses"] = oled_textcachestats["misses"] + 1
+		cacheitem = [fontbytes, len(textdata)*charwd, oled_rendertext(textdata, charht, charwd, y&0x7, fontbytes)]
+		oled_textcache[cachekey] = cacheitem
+		oled_textcache.move_to_end(cachekey)
+		while len(oled_textcache) > OLED_TEXTCACHESIZE:
+			oled_textcache.popitem(last=False)
+
+	# Clip columns to the screen
+	if colend is None or colend > cacheitem[1]:
+		colend = cacheitem[1]
+	if colstart < -x:
+		colstart = -x
+	if x + colend > OLED_WD:
+		colend = OLED_WD - x
+	if colend <= colstart:
 		return
 
-	numfontrow = charht>>3
-	ctr = 0
-	while ctr < len(textdata):
-		fontoffset = ord(textdata[ctr])*charwd
-		fontcol = 0
-		while fontcol < charwd and x < OLED_WD:
-			fontrow = 0
-			row = y
-			while fontrow < numfontrow and row < OLED_HT and x >= 0:
-				curbit = 0x80
-				curbyte = (fontbytes[fontoffset + fontcol + (OLED_NUMFONTCHAR*charwd*fontrow)])
-				subrow = 0
-				while subrow < 8 and row < OLED_HT:
-					value = 0
-					if (curbyte&curbit) != 0:
-						value = 1
-					oled_writebuffer(x,row,value, mode)
-					curbit = curbit >> 1
-					row = row + 1
-					subrow = subrow + 1
-				fontrow = fontrow + 1
-			fontcol = fontcol + 1
-			x = x + 1
-		ctr = ctr + 1
-
-def oled_fastwritetext(textdata, x, y, charht, charwd, fontbytes, mode = 0):
+	page = y>>3
+	for curpage in cacheitem[2]:
+		if page >= 0 and page < (OLED_HT>>3):
+			oled_writebytespan(OLED_WD*page + x + colstart, curpage[0][colstart:colend], curpage[1], mode)
+		page = page + 1
 
+# Returns list of [page bytes, page mask], the first page starting at row yphase
+def oled_rendertext(textdata, charht, charwd, yphase, fontbytes):
 	numfontrow = charht>>3
-	ctr = 0
-	while ctr < len(textdata):
-		fontoffset = ord(textdata[ctr])*charwd
-		fontcol = 0
-		while fontcol < charwd and x < OLED_WD:
-			fontrow = 0
-			row = y&0xF8
-			while fontrow < numfontrow and row < OLED_HT and x >= 0:
-				curbyte = (fontbytes[fontoffset + fontcol + (OLED_NUMFONTCHAR*charwd*fontrow)])
-				oled_writebyterow(x,row,curbyte, mode)
-				fontrow = fontrow + 1
-				row = row + 8
-			fontcol = fontcol + 1
-			x = x + 1
-		ctr = ctr + 1	
-	return
+	fontrowlist = []
+	fontrow = 0
+	while fontrow < numfontrow:
+		rowbytes = bytearray()
+		for curchar in textdata:
+			fontoffset = ord(curchar)*charwd + (OLED_NUMFONTCHAR*charwd*fontrow)
+			rowbytes.extend(fontbytes[fontoffset:(fontoffset+charwd)])
+		fontrowlist.append(bytes(rowbytes))
+		fontrow = fontrow + 1
+
+	if yphase == 0:
+		return [[rowbytes, 0xFF] for rowbytes in fontrowlist]
+
+	# Each font row is split across 2 pages
+	pagelist = []
+	prevrow = None
+	for rowbytes in fontrowlist:
+		pagebytes = rowbytes.translate(OLED_SHIFTLEFTTABLE[yphase])
+		if prevrow is None:
+			pagelist.append([pagebytes, (0xFF<<yphase)&0xFF])
+		else:
+			pagebytes = oled_orbytes(pagebytes, prevrow.translate(OLED_SHIFTRIGHTTABLE[8-yphase]))
+			pagelist.append([pagebytes, 0xFF])
+		prevrow = rowbytes
+	pagelist.append([prevrow.translate(OLED_SHIFTRIGHTTABLE[8-yphase]), 0xFF>>(8-yphase)])
+	return pagelist
+
+def oled_orbytes(a, b):
+	return (int.from_bytes(a, "little") | int.from_bytes(b, "little")).to_bytes(len(a), "little")
+
+# Writes span of bytes into a page, mode 0 replaces the rows in bytemask, 1 is XOR, otherwise OR
+def oled_writebytespan(bufferoffset, spanbytes, bytemask, mode = 0):
+	count = len(spanbytes)
+	spanend = bufferoffset + count
+	if mode == 0 and bytemask == 0xFF:
+		oled_imagebuffer[bufferoffset:spanend] = spanbytes
+		return
+	spanvalue = int.from_bytes(oled_imagebuffer[bufferoffset:spanend], "little")
+	bytesvalue = int.from_bytes(spanbytes, "little")
+	if mode == 0:
+		keepvalue = int.from_bytes(bytes((0xFF^bytemask,))*count, "little")
+		spanvalue = (spanvalue & keepvalue) | bytesvalue
+	elif mode == 1:
+		spanvalue = spanvalue ^ bytesvalue
+	else:
+		spanvalue = spanvalue | bytesvalue
+	oled_imagebuffer[bufferoffset:spanend] = spanvalue.to_bytes(count, "little")
+
+# Returns hits, misses, hit rate and entries of the rendered text cache
+def oled_gettextcachestats():
+	total = oled_textcachestats["hits"] + oled_textcachestats["misses"]
+	hitrate = 0
+	if total > 0:
+		hitrate = oled_textcachestats["hits"]/total
+	return {"hits": oled_textcachestats["hits"], "misses": oled_textcachestats["misses"], "hitrate": hitrate, "entries": len(oled_textcache)}
+
 
+# Last power state sent, None if unknown
+oled_powerstate = None
 
 def oled_power(turnon = True):
+	global oled_powerstate
+	if oled_powerstate == turnon:
+		return
 	cmd = 0xAE
 	if turnon == True:
 			cmd = cmd|1
 	try:
-		bus.write_byte_data(ADDR_OLED, 0, cmd)
+		oled_backend.command([cmd])
+		oled_powerstate = turnon
 	except:
+		oled_powerstate = None
 		return
 
 
@@ -285,7 +821,7 @@ def oled_inverse(enable = True):
 	if enable == True:
 			cmd = cmd|1
 	try:
-		bus.write_byte_data(ADDR_OLED, 0, cmd)
+		oled_backend.command([cmd])
 	except:
 		return
 
@@ -295,7 +831,7 @@ def oled_fullwhite(enable = True):
 	if enable == True:
 			cmd = cmd|1
 	try:
-		bus.write_byte_data(ADDR_OLED, 0, cmd)
+		oled_backend.command([cmd])
 	except:
 		return
 
@@ -303,29 +839,19 @@ def oled_fullwhite(enable = True):
 
 def oled_reset():
 	try:
-		# Set COM-H Addressing
-		bus.write_byte_data(ADDR_OLED, 0, 0x20)
-		bus.write_byte_data(ADDR_OLED, 0, 0x1)
-
-		# Set Column range
-		bus.write_byte_data(ADDR_OLED, 0, 0x21)
-		bus.write_byte_data(ADDR_OLED, 0, 0)
-		bus.write_byte_data(ADDR_OLED, 0, OLED_WD-1)
-
-		# Set Row Range
-		bus.write_byte_data(ADDR_OLED, 0, 0x22)
-		bus.write_byte_data(ADDR_OLED, 0, 0)
-		bus.write_byte_data(ADDR_OLED, 0, (OLED_HT>>3)-1)
-
-		# Set Page Addressing
-		bus.write_byte_data(ADDR_OLED, 0, 0x20)
-		bus.write_byte_data(ADDR_OLED, 0, 0x2)
-		# Set GDDRAM Address
-		bus.write_byte_data(ADDR_OLED, 0, 0xB0)
-
-		# Set Display Start Line
-		bus.write_byte_data(ADDR_OLED, 0, 0x40)
+		oled_backend.command([
+			# Set COM-H Addressing
+			0x20, 0x1,
+			# Set Column range
+			0x21, 0, OLED_WD-1,
+			# Set Row Range
+			0x22, 0, (OLED_HT>>3)-1,
+			# Set Page Addressing
+			0x20, 0x2,
+			# Set GDDRAM Address
+			0xB0,
+			# Set Display Start Line
+			0x40
+		])
 	except:
 		return
-
-
@@ -0,0 +1,890 @@
+#!/usr/bin/python3
+
+#
+# OLED page layouts for argononed
+#
+# Each page is described once as a static layer (background and fixed labels) and a
+# list of fields. The static layer is rendered once and cached, a refresh only redraws
+# the fields whose value changed, so only those blocks are sent to the display.
+#
+# Layout format:
+#   "bg": background asset name
+#   "labels": list of fixed text, {"text", "x", "y", "wd", "align", "font"}
+#   "fields": list of {"name", "type", "x", "y", "wd", "ht", ...}, drawn in order
+#      "text": "align" (0 left, 1 centered, 2 right), "font" (char width, 6 or 8),
+#              "scroll": text wider than the field scrolls through it, see argoneonpages_tickscroll
+#      "bar": "maxvalue", "vertical", "mode" (see oled_drawbargraph)
+#      "graph": value is [sample count, minvalue, maxvalue, samples], see argoneonpages_graphvalues
+#               Newest sample is on the right, one column each. When only new samples were
+#               added, the graph is scrolled and only the new columns are drawn
+#
+# Field values are passed as a dict keyed by field name, missing fields are left blank
+#
+# Graph pages show the history kept by argoneonpages_historytask, which runs on the
+# argononed timer.
+#
+# Page data comes from providers, each with its own refresh interval. Expensive ones
+# (subprocesses like df and mdadm) are refreshed ahead of time in a worker pool, so
+# switching to a page uses the cached data and never waits for them.
+#
+# Custom pages are loaded from ARGONEONPAGES_PLUGINPATH, one .py file per page, the
+# file name being the page name (as used in screenlist of /etc/argoneonoled.conf):
+#   PAGE_TITLE: description shown by argoneon-oledconfig.sh
+#   PAGE_LAYOUT: page layout, see above
+#   page_provider(): returns the page data, runs in its own worker thread
+#   page_render(data): returns the field values for the data
+#   PAGE_INTERVAL (optional): seconds between page_provider calls
+#   PAGE_PAGESIZE (optional): items per screen if the data is a list
+#   PAGE_BUDGET (optional): seconds page_provider can take, the page is skipped while it's late
+# The module is loaded and page_render is called in a worker thread of the page. Loading has
+# to finish within ARGONEONPAGES_PLUGINLOADBUDGET, otherwise the page isn't loaded. A page_render
+# that goes over ARGONEONPAGES_RENDERBUDGET is skipped, the page is disabled after
+# ARGONEONPAGES_RENDERSTRIKES in a row (the late worker is left running, it can't be stopped)
+#
+
+import os
+import sys
+import time
+import array
+import datetime
+import importlib.util
+import threading
+import concurrent.futures
+sys.path.append("/etc/argon/")
+from argonsysinfo import *
+from argoneonoled import *
+
+ARGONEONPAGES_FONTSML = 6	# Maps to 6x8
+ARGONEONPAGES_FONTREG = 8	# Maps to 8x16
+ARGONEONPAGES_LEFTOFFSET = 54
+
+# Scrolling text, frames per second (see argoneonpages_setscrollrate) and pixels per second
+ARGONEONPAGES_SCROLLRATE = 8
+ARGONEONPAGES_SCROLLSPEED = 24
+# Seconds before the text starts to move, and the space between its end and start
+ARGONEONPAGES_SCROLLPAUSE = 2
+ARGONEONPAGES_SCROLLGAP = "   "
+
+ARGONEONPAGES_WEEKDAYLIST = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+ARGONEONPAGES_MONTHLIST = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+
+
+def argoneonpages_textfield(name, x, y, wd, align = 0, font = ARGONEONPAGES_FONTSML, scroll = False):
+	return {"name": name, "type": "text", "x": x, "y": y, "wd": wd, "align": align, "font": font, "scroll": scroll}
+
+def argoneonpages_barfield(name, x, y, wd, ht, maxvalue = 100, vertical = False, mode = 0):
+	return {"name": name, "type": "bar", "x": x, "y": y, "wd": wd, "ht": ht, "maxvalue": maxvalue, "vertical": vertical, "mode": mode}
+
+def argoneonpages_label(text, x, y, wd, align = 0, font = ARGONEONPAGES_FONTSML):
+	return {"text": text, "x": x, "y": y, "wd": wd, "align": align, "font": font}
+
+
+def argoneonpages_buildlayouts():
+	leftoffset = ARGONEONPAGES_LEFTOFFSET
+	rightwd = OLED_WD - leftoffset
+	fontsml = ARGONEONPAGES_FONTSML
+	fontreg = ARGONEONPAGES_FONTREG
+
+	output = {}
+
+	fieldlist = []
+	idx = 0
+	while idx < 4:
+		fieldlist.append(argoneonpages_textfield("line"+str(idx), leftoffset, 16*idx, rightwd))
+		fieldlist.append(argoneonpages_barfield("bar"+str(idx), leftoffset, 16*idx+12, rightwd-4, 2))
+		idx = idx + 1
+	output["cpu"] = {"bg": "bgcpu", "labels": [], "fields": fieldlist}
+
+	fieldlist = []
+	idx = 0
+	while idx < 3:
+		# Right column first, safer to overwrite white space
+		fieldlist.append(argoneonpages_textfield("size"+str(idx), 77, 16+16*idx, OLED_WD-77, 2))
+		fieldlist.append(argoneonpages_textfield("usage"+str(idx), 50, 16+16*idx, 74-50, 2))
+		fieldlist.append(argoneonpages_textfield("name"+str(idx), 0, 16+16*idx, 48, 0, fontsml, True))
+		idx = idx + 1
+	output["storage"] = {"bg": "bgstorage", "labels": [], "fields": fieldlist}
+
+	output["raid"] = {"bg": "bgraid",
+		"labels": [
+			argoneonpages_label("Used:", leftoffset, 8, rightwd),
+			argoneonpages_label("Active:", leftoffset, 32, rightwd),
+			argoneonpages_label("Working:", leftoffset, 40, rightwd),
+			argoneonpages_label("Failed:", leftoffset, 48, rightwd)
+		],
+		"fields": [
+			argoneonpages_textfield("title", 0, 0, leftoffset, 1, fontsml, True),
+			argoneonpages_textfield("value", 0, 8, leftoffset, 1, fontsml, True),
+			argoneonpages_textfield("size", 0, 56, leftoffset, 1),
+			argoneonpages_textfield("used", leftoffset+5*fontsml, 8, rightwd-5*fontsml),
+			argoneonpages_textfield("usedpct", leftoffset+6*fontsml, 16, rightwd-6*fontsml),
+			argoneonpages_textfield("active", leftoffset+7*fontsml, 32, rightwd-7*fontsml),
+			argoneonpages_textfield("working", leftoffset+8*fontsml, 40, rightwd-8*fontsml),
+			argoneonpages_textfield("failed", leftoffset+7*fontsml, 48, rightwd-7*fontsml)
+		]}
+
+	output["ram"] = {"bg": "bgram",
+		"labels": [argoneonpages_label("of", leftoffset, 24, rightwd, 1, fontreg)],
+		"fields": [
+			argoneonpages_textfield("free", leftoffset, 8, rightwd, 1, fontreg),
+			argoneonpages_textfield("total", leftoffset, 40, rightwd, 1, fontreg)
+		]}
+
+	output["temp"] = {"bg": "bgtemp", "labels": [],
+		"fields": [
+			argoneonpages_textfield("celsius", leftoffset, 16, rightwd, 1, fontreg),
+			argoneonpages_textfield("fahrenheit", leftoffset, 32, rightwd, 1, fontreg),
+			argoneonpages_barfield("bar", 24, 20, 3, 21, 21, True, 2)
+		]}
+
+	output["ip"] = {"bg": "bgip", "labels": [],
+		"fields": [argoneonpages_textfield("ip", 0, 8, OLED_WD, 1, fontreg, True)]}
+
+	output["clock"] = {"bg": "bgtime", "labels": [],
+		"fields": [
+			argoneonpages_textfield("date", leftoffset, 8, rightwd, 1, fontreg),
+			argoneonpages_textfield("weekday", leftoffset, 24, rightwd, 1, fontreg),
+			argoneonpages_textfield("time", leftoffset, 40, rightwd, 1, fontreg)
+		]}
+	return output
+
+argoneonpages_layoutlist = argoneonpages_buildlayouts()
+# Rendered static layers and last drawn values, keyed by page name
+argoneonpages_compiledlist = {}
+argoneonpages_curpage = ""
+
+
+# Adds or replaces a page layout, e.g. for custom pages
+def argoneonpages_addlayout(pagename, layout):
+	argoneonpages_layoutlist[pagename] = layout
+	argoneonpages_compiledlist.pop(pagename, None)
+
+def argoneonpages_haslayout(pagename):
+	return pagename in argoneonpages_layoutlist
+
+def argoneonpages_compile(pagename):
+	layout = argoneonpages_layoutlist[pagename]
+	oled_loadbg(layout.get("bg", "bgblack"))
+	for curlabel in layout.get("labels", []):
+		oled_writetextaligned(curlabel["text"], curlabel["x"], curlabel["y"], curlabel["wd"], curlabel.get("align", 0), curlabel.get("font", ARGONEONPAGES_FONTSML))
+	return {"layout": layout, "static": oled_getbuffer(), "values": {}, "extents": {}, "frame": None, "scrollstart": {}, "scrolloffset": {}}
+
+# Returns the area covered by the field when drawn with value, [x, y, wd, ht]
+def argoneonpages_getextent(field, value):
+	x = field["x"]
+	wd = field["wd"]
+	ht = field.get("ht", 0)
+	if field["type"] == "text":
+		charwd = field.get("font", ARGONEONPAGES_FONTSML)
+		ht = oled_getcharheight(charwd)
+		if argoneonpages_isscrolling(field, value) == True:
+			return [x, field["y"], wd, ht]
+		textwd = len(value)*charwd
+		align = field.get("align", 0)
+		if align == 1:
+			x = x + ((wd-textwd)>>1)
+		elif align == 2:
+			x = x + wd - textwd
+		wd = textwd
+	return [x, field["y"], wd, ht]
+
+def argoneonpages_isoverlapping(extent, extentlist):
+	for curextent in extentlist:
+		if extent[0] < curextent[0]+curextent[2] and curextent[0] < extent[0]+extent[2] and extent[1] < curextent[1]+curextent[3] and curextent[1] < extent[1]+extent[3]:
+			return True
+	return False
+
+def argoneonpages_isscrolling(field, value):
+	if field["type"] != "text" or field.get("scroll", False) == False or value is None:
+		return False
+	return len(value)*field.get("font", ARGONEONPAGES_FONTSML) > field["wd"]
+
+# Scroll position in pixels, elapsed is the seconds since the value was set
+def argoneonpages_getscrolloffset(field, value, elapsed):
+	elapsed = elapsed - ARGONEONPAGES_SCROLLPAUSE
+	if elapsed <= 0 or argoneonpages_isscrolling(field, value) == False:
+		return 0
+	# Whole frames, so the text moves by the same step each frame
+	offset = int(int(elapsed*ARGONEONPAGES_SCROLLRATE)*ARGONEONPAGES_SCROLLSPEED/ARGONEONPAGES_SCROLLRATE)
+	return offset % ((len(value)+len(ARGONEONPAGES_SCROLLGAP))*field.get("font", ARGONEONPAGES_FONTSML))
+
+def argoneonpages_setscrollrate(framespersec):
+	global ARGONEONPAGES_SCROLLRATE
+	if framespersec > 0:
+		ARGONEONPAGES_SCROLLRATE = framespersec
+
+def argoneonpages_drawfield(field, value, scrolloffset = 0):
+	if argoneonpages_isscrolling(field, value) == True:
+		# Text is repeated so its start follows the end
+		oled_writetextwindow(value+ARGONEONPAGES_SCROLLGAP+value, field["x"]-scrolloffset, field["y"], scrolloffset, scrolloffset+field["wd"], field.get("font", ARGONEONPAGES_FONTSML))
+	elif field["type"] == "text":
+		oled_writetextaligned(value, field["x"], field["y"], field["wd"], field.get("align", 0), field.get("font", ARGONEONPAGES_FONTSML))
+	elif field["type"] == "bar":
+		oled_drawbargraph(field["x"], field["y"], field["wd"], field["ht"], value, field.get("maxvalue", 100), field.get("mode", 0), field.get("vertical", False))
+	elif field["type"] == "graph":
+		argoneonpages_drawgraphcolumns(field, value, field["wd"])
+
+# Draws the newest count samples of the graph, from the right edge
+def argoneonpages_drawgraphcolumns(field, value, count):
+	minvalue = value[1]
+	valuerange = value[2] - minvalue
+	samplelist = value[3]
+	if count > len(samplelist):
+		count = len(samplelist)
+	if valuerange <= 0 or count <= 0:
+		return
+	ht = field["ht"]
+	ymax = field["y"] + ht
+	colx = field["x"] + field["wd"] - count
+	for cursample in samplelist[len(samplelist)-count:]:
+		colht = int(ht*(cursample-minvalue)/valuerange + 0.5)
+		if colht > ht:
+			colht = ht
+		if colht > 0:
+			oled_drawfilledrectangle(colx, ymax-colht, 1, colht)
+		colx = colx + 1
+
+# Columns the graph can be scrolled by to show the new value, 0 if it has to be redrawn
+def argoneonpages_getgraphshift(field, prevvalue, newvalue, extentlist):
+	if prevvalue is None or newvalue is None:
+		return 0
+	if prevvalue[1] != newvalue[1] or prevvalue[2] != newvalue[2]:
+		# Scale changed
+		return 0
+	shift = newvalue[0] - prevvalue[0]
+	if shift <= 0 or shift >= field["wd"]:
+		return 0
+	if argoneonpages_isoverlapping([field["x"], field["y"], field["wd"], field["ht"]], extentlist) == True:
+		# Other fields would be scrolled along
+		return 0
+	return shift
+
+# Draws the page into the framebuffer, returns number of fields redrawn
+# Only fields that changed since the last render of the same page are redrawn,
+# unless the framebuffer was changed by something else in between, or they're in forcelist
+def argoneonpages_render(pagename, values, forcelist = []):
+	global argoneonpages_curpage
+	compiled = argoneonpages_compiledlist.get(pagename)
+	if compiled is None:
+		compiled = argoneonpages_compile(pagename)
+		argoneonpages_compiledlist[pagename] = compiled
+		argoneonpages_curpage = ""
+
+	if argoneonpages_curpage != pagename or compiled["frame"] != oled_imagebuffer:
+		oled_setbuffer(compiled["static"])
+		compiled["values"] = {}
+		compiled["extents"] = {}
+		argoneonpages_curpage = pagename
+
+	# Clear the changed fields back to the static layer
+	staticbuffer = compiled["static"]
+	fieldlist = compiled["layout"]["fields"]
+	redrawlist = []
+	arealist = []
+	# Graphs that only need new columns, keyed by field name
+	graphshiftlist = {}
+	for curfield in fieldlist:
+		fieldname = curfield["name"]
+		newvalue = values.get(fieldname)
+		if fieldname in compiled["values"] and compiled["values"][fieldname] == newvalue:
+			if fieldname not in forcelist:
+				continue
+		else:
+			compiled["scrollstart"][fieldname] = time.monotonic()
+		redrawlist.append(fieldname)
+		if curfield["type"] == "graph":
+			otherextentlist = [compiled["extents"][curname] for curname in compiled["extents"] if curname != fieldname]
+			shift = argoneonpages_getgraphshift(curfield, compiled["values"].get(fieldname), newvalue, otherextentlist)
+			if shift > 0:
+				graphshiftlist[fieldname] = shift
+				arealist.append(compiled["extents"][fieldname])
+				continue
+		prevextent = compiled["extents"].pop(fieldname, None)
+		if prevextent is not None:
+			oled_copyregion(staticbuffer, prevextent[0], prevextent[1], prevextent[2], prevextent[3])
+			arealist.append(prevextent)
+		if newvalue is not None:
+			arealist.append(argoneonpages_getextent(curfield, newvalue))
+
+	# Unchanged fields overlapping a redrawn area are redrawn too, to keep the draw order
+	addflag = True
+	while addflag == True:
+		addflag = False
+		for curfield in fieldlist:
+			fieldname = curfield["name"]
+			curextent = compiled["extents"].get(fieldname)
+			if fieldname in redrawlist or curextent is None:
+				continue
+			if argoneonpages_isoverlapping(curextent, arealist) == True:
+				redrawlist.append(fieldname)
+				arealist.append(curextent)
+				addflag = True
+
+	for curfield in fieldlist:
+		fieldname = curfield["name"]
+		if fieldname not in redrawlist:
+			continue
+		newvalue = values.get(fieldname)
+		if fieldname in graphshiftlist:
+			shift = graphshiftlist[fieldname]
+			oled_scrollregionleft(curfield["x"], curfield["y"], curfield["wd"], curfield["ht"], shift)
+			oled_copyregion(staticbuffer, curfield["x"]+curfield["wd"]-shift, curfield["y"], shift, curfield["ht"])
+			argoneonpages_drawgraphcolumns(curfield, newvalue, shift)
+		elif newvalue is not None:
+			scrolloffset = argoneonpages_getscrolloffset(curfield, newvalue, time.monotonic()-compiled["scrollstart"].get(fieldname, 0))
+			compiled["scrolloffset"][fieldname] = scrolloffset
+			argoneonpages_drawfield(curfield, newvalue, scrolloffset)
+			compiled["extents"][fieldname] = argoneonpages_getextent(curfield, newvalue)
+		compiled["values"][fieldname] = newvalue
+
+	compiled["frame"] = oled_getbuffer()
+	return len(redrawlist)
+
+# Moves the scrolling text of the page, returns True if the framebuffer changed
+# Nothing is done unless the page is the one in the framebuffer
+def argoneonpages_tickscroll(pagename):
+	compiled = argoneonpages_compiledlist.get(pagename)
+	if compiled is None or argoneonpages_curpage != pagename or compiled["frame"] != oled_imagebuffer:
+		return False
+	forcelist = []
+	curtime = time.monotonic()
+	for curfield in compiled["layout"]["fields"]:
+		fieldname = curfield["name"]
+		curvalue = compiled["values"].get(fieldname)
+		if argoneonpages_isscrolling(curfield, curvalue) == False:
+			continue
+		if argoneonpages_getscrolloffset(curfield, curvalue, curtime-compiled["scrollstart"].get(fieldname, 0)) != compiled["scrolloffset"].get(fieldname):
+			forcelist.append(fieldname)
+	if len(forcelist) == 0:
+		return False
+	argoneonpages_render(pagename, dict(compiled["values"]), forcelist)
+	return True
+
+# Seconds to the next scroll step, None if no text of the page is scrolling
+# Includes the pause before the text starts to move
+def argoneonpages_getscrollwait(pagename):
+	compiled = argoneonpages_compiledlist.get(pagename)
+	if compiled is None or argoneonpages_curpage != pagename:
+		return None
+	output = None
+	curtime = time.monotonic()
+	for curfield in compiled["layout"]["fields"]:
+		fieldname = curfield["name"]
+		if argoneonpages_isscrolling(curfield, compiled["values"].get(fieldname)) == False:
+			continue
+		elapsed = curtime - compiled["scrollstart"].get(fieldname, 0) - ARGONEONPAGES_SCROLLPAUSE
+		# Offset changes on the next whole frame, see argoneonpages_getscrolloffset
+		waitsec = (max(int(elapsed*ARGONEONPAGES_SCROLLRATE), 0) + 1)/ARGONEONPAGES_SCROLLRATE - elapsed
+		if output is None or waitsec < output:
+			output = waitsec
+	return output
+
+
+# Field values for the built-in pages
+
+def argoneonpages_cpuvalues(cpulist):
+	output = {}
+	idx = 0
+	for tmpitem in cpulist[0:4]:
+		output["line"+str(idx)] = tmpitem["title"]+": "+str(tmpitem["value"])+"%"
+		output["bar"+str(idx)] = tmpitem["value"]
+		idx = idx + 1
+	return output
+
+def argoneonpages_storagevalues(storagelist):
+	output = {}
+	idx = 0
+	for tmpitem in storagelist[0:3]:
+		output["size"+str(idx)] = tmpitem["value"]
+		output["usage"+str(idx)] = str(tmpitem["usage"])+"%"
+		# Long names scroll
+		output["name"+str(idx)] = tmpitem["title"]
+		idx = idx + 1
+	return output
+
+def argoneonpages_raidvalues(raiditem):
+	raidinfo = raiditem["info"]
+	devicestr = "/"+str(int(raidinfo["devices"]))
+	return {
+		"title": raiditem["title"],
+		"value": raiditem["value"],
+		"size": argonsysinfo_kbstr(raidinfo["size"]),
+		"used": argonsysinfo_kbstr(raidinfo["used"]),
+		"usedpct": str(int(100*raidinfo["used"]/raidinfo["size"]))+"%",
+		"active": str(int(raidinfo["active"]))+devicestr,
+		"working": str(int(raidinfo["working"]))+devicestr,
+		"failed": str(int(raidinfo["failed"]))+devicestr
+	}
+
+def argoneonpages_ramvalues(raminfo):
+	return {"free": raminfo[0], "total": raminfo[1]}
+
+def argoneonpages_tempvalues(cval):
+	fval = 32+9*cval/5
+	# 40C is min, 80C is max
+	maxht = 21
+	barht = int(maxht*(cval-40)/40)
+	if barht > maxht:
+		barht = maxht
+	elif barht < 1:
+		barht = 1
+
+	tmpcstr = str(cval)
+	if len(tmpcstr) > 4:
+		tmpcstr = tmpcstr[0:4]
+	tmpfstr = str(fval)
+	if len(tmpfstr) > 5:
+		tmpfstr = tmpfstr[0:5]
+	return {"celsius": tmpcstr+chr(167)+"C", "fahrenheit": tmpfstr+chr(167)+"F", "bar": barht}
+
+def argoneonpages_ipvalues(ipaddress):
+	return {"ip": ipaddress}
+
+def argoneonpages_clockvalues(curtime):
+	# Month/Day
+	outstr = str(curtime.day).strip()
+	if len(outstr) < 2:
+		outstr = " "+outstr
+	datestr = ARGONEONPAGES_MONTHLIST[curtime.month-1]+outstr
+
+	# Time HH:MM
+	outstr = str(curtime.minute).strip()
+	if len(outstr) < 2:
+		outstr = "0"+outstr
+	outstr = str(curtime.hour)+":"+outstr
+	if len(outstr) < 5:
+		outstr = "0"+outstr
+	return {"date": datestr, "weekday": ARGONEONPAGES_WEEKDAYLIST[curtime.weekday()], "time": outstr}
+
+
+# Data providers
+
+# Previous snapshot, usage is computed since the last call instead of sleeping
+argoneonpages_cpusnapshot = {}
+
+def argoneonpages_getcpudata():
+	global argoneonpages_cpusnapshot
+	cursnapshot = argonsysinfo_getcpuusagesnapshot()
+	output = argonsysinfo_getcpuusage(argoneonpages_cpusnapshot, cursnapshot)
+	if len(argoneonpages_cpusnapshot) == 0:
+		# First call, usage since boot
+		output = argonsysinfo_getcpuusage({curname: {"total": 0, "idle": 0} for curname in cursnapshot}, cursnapshot)
+	argoneonpages_cpusnapshot = cursnapshot
+	return output
+
+def argoneonpages_getstoragedata():
+	output = []
+	tmpobj = argonsysinfo_listhddusage()
+	for curdev in tmpobj:
+		output.append({"title": curdev, "value": argonsysinfo_kbstr(tmpobj[curdev]['total']), "usage": int(100*tmpobj[curdev]['used']/tmpobj[curdev]['total']) })
+	return output
+
+def argoneonpages_getraiddata():
+	return argonsysinfo_listraid()['raidlist']
+
+def argoneonpages_getclockdata():
+	# Only the minute is shown
+	return datetime.datetime.now().replace(second=0, microsecond=0)
+
+
+# Cheap providers are called in the display thread when their data is stale
+ARGONEONPAGES_COSTCHEAP = 0
+# Expensive providers are only called by the worker pool
+ARGONEONPAGES_COSTEXPENSIVE = 1
+
+ARGONEONPAGES_WORKERCOUNT = 2
+
+ARGONEONPAGES_PLUGINPATH = "/etc/argon/pages.d/"
+ARGONEONPAGES_PLUGININTERVAL = 60
+ARGONEONPAGES_PLUGINBUDGET = 5
+ARGONEONPAGES_RENDERBUDGET = 0.1
+ARGONEONPAGES_RENDERSTRIKES = 3
+ARGONEONPAGES_PLUGINLOADBUDGET = 2
+
+# Page definitions, keyed by page name (layout is in argoneonpages_layoutlist)
+#   "provider": returns the page data
+#   "values": converts data to field values (see argoneonpages_render)
+#   "interval": seconds before the data is refreshed
+#   "cost": ARGONEONPAGES_COSTCHEAP or ARGONEONPAGES_COSTEXPENSIVE
+#   "pagesize": items shown per screen if the data is a list, otherwise 0
+#   "aligned": refresh when the wall clock crosses a multiple of interval (e.g. each minute),
+#              instead of interval seconds after the last refresh
+#   "budget": seconds an expensive provider can take before the page is skipped, None if no limit
+#             Each of these pages gets its own worker, so a stuck provider doesn't hold up others
+#   "overruns": values function calls of a plugin in a row that went over ARGONEONPAGES_RENDERBUDGET
+#   "disabled": set when overruns reaches ARGONEONPAGES_RENDERSTRIKES
+argoneonpages_pagelist = {}
+
+# Provider data, keyed by page name: "data", "time" (monotonic), "walltime", "version",
+# "future", "submittime" (monotonic), "overrun"
+argoneonpages_providerstate = {}
+argoneonpages_providerlock = threading.Lock()
+argoneonpages_workerpool = None
+# Workers of pages with a budget, keyed by page name
+argoneonpages_pageworkerpool = {}
+# Loaded plugin page names, and load errors keyed by page name
+argoneonpages_pluginlist = []
+argoneonpages_pluginerrors = {}
+# Workers that load plugins and run their values function, keyed by page name
+argoneonpages_pluginworkerpool = {}
+# Called with the page name when the worker pool loads new data
+argoneonpages_notifyfunc = None
+
+
+def argoneonpages_addpage(pagename, provider, valuesfunc, interval, cost = ARGONEONPAGES_COSTCHEAP, pagesize = 0, layout = None, aligned = False, budget = None):
+	argoneonpages_pagelist[pagename] = {"provider": provider, "values": valuesfunc, "interval": interval, "cost": cost, "pagesize": pagesize, "aligned": aligned, "budget": budget, "overruns": 0, "disabled": False}
+	if layout is not None:
+		argoneonpages_addlayout(pagename, layout)
+	with argoneonpages_providerlock:
+		argoneonpages_providerstate.pop(pagename, None)
+
+def argoneonpages_haspage(pagename):
+	return pagename in argoneonpages_pagelist and pagename in argoneonpages_layoutlist
+
+def argoneonpages_getstate(pagename):
+	curstate = argoneonpages_providerstate.get(pagename)
+	if curstate is None:
+		curstate = {"data": None, "time": None, "walltime": None, "version": 0, "future": None, "submittime": None, "overrun": False}
+		argoneonpages_providerstate[pagename] = curstate
+	return curstate
+
+def argoneonpages_isstale(pagename, curstate):
+	return argoneonpages_getstalewait(pagename, curstate) <= 0
+
+# Seconds until the data needs a refresh
+def argoneonpages_getstalewait(pagename, curstate):
+	if curstate["time"] is None:
+		return 0
+	curpage = argoneonpages_pagelist[pagename]
+	interval = curpage["interval"]
+	if curpage["aligned"] == True:
+		# Wall clock based, so clock changes (NTP, RTC) are picked up on the next check
+		curwalltime = time.time()
+		if int(curwalltime//interval) != int(curstate["walltime"]//interval):
+			return 0
+		return interval - (curwalltime % interval)
+	return curstate["time"] + interval - time.monotonic()
+
+def argoneonpages_setdata(pagename, data):
+	with argoneonpages_providerlock:
+		curstate = argoneonpages_getstate(pagename)
+		curstate["time"] = time.monotonic()
+		curstate["walltime"] = time.time()
+		curstate["future"] = None
+		if curstate["overrun"] == True:
+			curstate["overrun"] = False
+			curstate["data"] = None
+		if curstate["version"] == 0 or curstate["data"] != data:
+			curstate["data"] = data
+			curstate["version"] = curstate["version"] + 1
+
+def argoneonpages_runprovider(pagename, notifyflag = False):
+	try:
+		data = argoneonpages_pagelist[pagename]["provider"]()
+	except Exception:
+		# Shown as no data, the page is skipped
+		data = None
+	prevversion = argoneonpages_getversion(pagename)
+	argoneonpages_setdata(pagename, data)
+	if notifyflag == True and argoneonpages_notifyfunc is not None and argoneonpages_getversion(pagename) != prevversion:
+		argoneonpages_notifyfunc(pagename)
+
+# func(pagename) is called from the worker thread when an expensive provider has new data
+def argoneonpages_setnotify(func):
+	global argoneonpages_notifyfunc
+	argoneonpages_notifyfunc = func
+
+def argoneonpages_getworkerpool(pagename):
+	global argoneonpages_workerpool
+	if argoneonpages_pagelist[pagename]["budget"] is not None:
+		if pagename not in argoneonpages_pageworkerpool:
+			argoneonpages_pageworkerpool[pagename] = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+		return argoneonpages_pageworkerpool[pagename]
+	if argoneonpages_workerpool is None:
+		argoneonpages_workerpool = concurrent.futures.ThreadPoolExecutor(max_workers=ARGONEONPAGES_WORKERCOUNT)
+	return argoneonpages_workerpool
+
+# Seconds left before a running provider goes over its budget, None if no budget
+def argoneonpages_getbudgetwait(pagename, curstate):
+	budget = argoneonpages_pagelist[pagename]["budget"]
+	if budget is None or curstate["future"] is None or curstate["overrun"] == True:
+		return None
+	return curstate["submittime"] + budget - time.monotonic()
+
+# Starts refreshing the stale expensive providers of the pages in the background
+# The cheap provider of curpage, if any, is refreshed right away
+def argoneonpages_refreshproviders(pagenamelist, curpage = ""):
+	for pagename in pagenamelist:
+		if pagename not in argoneonpages_pagelist:
+			continue
+		with argoneonpages_providerlock:
+			curstate = argoneonpages_getstate(pagename)
+			if curstate["future"] is not None:
+				budgetwait = argoneonpages_getbudgetwait(pagename, curstate)
+				if budgetwait is not None and budgetwait <= 0:
+					# Late, the page is skipped until the provider returns
+					curstate["overrun"] = True
+					curstate["data"] = None
+					curstate["version"] = curstate["version"] + 1
+				continue
+			if argoneonpages_isstale(pagename, curstate) == False:
+				continue
+			if argoneonpages_pagelist[pagename]["cost"] != ARGONEONPAGES_COSTEXPENSIVE:
+				if pagename != curpage:
+					continue
+			else:
+				curstate["future"] = argoneonpages_getworkerpool(pagename).submit(argoneonpages_runprovider, pagename, True)
+				curstate["submittime"] = time.monotonic()
+				continue
+		argoneonpages_runprovider(pagename)
+
+# Seconds until refreshproviders has something to do for the same pages, None if nothing
+# Expensive providers already running are only counted for their budget, they notify when done
+def argoneonpages_getrefreshwait(pagenamelist, curpage = ""):
+	output = None
+	with argoneonpages_providerlock:
+		for pagename in pagenamelist:
+			if pagename not in argoneonpages_pagelist:
+				continue
+			if pagename != curpage and argoneonpages_pagelist[pagename]["cost"] != ARGONEONPAGES_COSTEXPENSIVE:
+				continue
+			curstate = argoneonpages_getstate(pagename)
+			if curstate["future"] is not None:
+				waitsec = argoneonpages_getbudgetwait(pagename, curstate)
+			else:
+				waitsec = argoneonpages_getstalewait(pagename, curstate)
+			if waitsec is None:
+				continue
+			if output is None or waitsec < output:
+				output = waitsec
+	if output is not None and output < 0:
+		return 0
+	return output
+
+# Returns the cached data and its version, the version changes when the data changes
+# Stale cheap data is refreshed first, expensive data is returned as is (None if not loaded yet)
+def argoneonpages_getdata(pagename):
+	argoneonpages_refreshproviders([pagename], pagename)
+	with argoneonpages_providerlock:
+		curstate = argoneonpages_getstate(pagename)
+		return [curstate["data"], curstate["version"]]
+
+def argoneonpages_getversion(pagename):
+	with argoneonpages_providerlock:
+		return argoneonpages_getstate(pagename)["version"]
+
+# Splits the page data into screens, each is passed to the values function
+def argoneonpages_getscreens(pagename, data):
+	if data is None or argoneonpages_pagelist[pagename]["disabled"] == True:
+		return []
+	pagesize = argoneonpages_pagelist[pagename]["pagesize"]
+	if pagesize <= 0:
+		return [data]
+	elif pagesize == 1:
+		return list(data)
+	output = []
+	idx = 0
+	while idx < len(data):
+		output.append(data[idx:idx+pagesize])
+		idx = idx + pagesize
+	return output
+
+# Runs func in the plugin worker of the page, raises TimeoutError if it takes more than budget seconds
+# The late worker is dropped, the next call gets a new one
+def argoneonpages_runplugin(pagename, budget, func, *args):
+	workerpool = argoneonpages_pluginworkerpool.get(pagename)
+	if workerpool is None:
+		workerpool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+		argoneonpages_pluginworkerpool[pagename] = workerpool
+	future = workerpool.submit(func, *args)
+	try:
+		return future.result(timeout=budget)
+	except concurrent.futures.TimeoutError:
+		argoneonpages_pluginworkerpool.pop(pagename).shutdown(wait=False)
+		raise TimeoutError(pagename+" took more than "+str(budget)+"s")
+
+def argoneonpages_renderscreen(pagename, screendata):
+	curpage = argoneonpages_pagelist[pagename]
+	if pagename not in argoneonpages_pluginlist:
+		return argoneonpages_render(pagename, curpage["values"](screendata))
+	try:
+		values = argoneonpages_runplugin(pagename, ARGONEONPAGES_RENDERBUDGET, curpage["values"], screendata)
+	except TimeoutError:
+		# Frame is skipped, the page too if it's late every time
+		curpage["overruns"] = curpage["overruns"] + 1
+		if curpage["overruns"] >= ARGONEONPAGES_RENDERSTRIKES:
+			curpage["disabled"] = True
+		raise
+	curpage["overruns"] = 0
+	return argoneonpages_render(pagename, values)
+
+def argoneonpages_stopproviders():
+	global argoneonpages_workerpool
+	if argoneonpages_workerpool is not None:
+		argoneonpages_workerpool.shutdown(wait=False)
+		argoneonpages_workerpool = None
+	for pagename in list(argoneonpages_pageworkerpool):
+		argoneonpages_pageworkerpool.pop(pagename).shutdown(wait=False)
+	for pagename in list(argoneonpages_pluginworkerpool):
+		argoneonpages_pluginworkerpool.pop(pagename).shutdown(wait=False)
+
+def argoneonpages_importplugin(pagename, fname):
+	spec = importlib.util.spec_from_file_location("argoneonpage_"+pagename, fname)
+	plugin = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(plugin)
+	return plugin
+
+# Loads custom pages, returns list of page names loaded
+# Files named after built-in pages are ignored
+def argoneonpages_loadplugins(pluginpath = ARGONEONPAGES_PLUGINPATH):
+	output = []
+	try:
+		filelist = sorted(os.listdir(pluginpath))
+	except OSError:
+		return output
+	for fname in filelist:
+		if fname[-3:] != ".py" or fname[0] == ".":
+			continue
+		pagename = fname[:-3]
+		if pagename in argoneonpages_pagelist and pagename not in argoneonpages_pluginlist:
+			argoneonpages_pluginerrors[pagename] = "Page name already used"
+			continue
+		try:
+			plugin = argoneonpages_runplugin(pagename, ARGONEONPAGES_PLUGINLOADBUDGET, argoneonpages_importplugin, pagename, os.path.join(pluginpath, fname))
+			argoneonpages_addpage(pagename, plugin.page_provider, plugin.page_render,
+				getattr(plugin, "PAGE_INTERVAL", ARGONEONPAGES_PLUGININTERVAL), ARGONEONPAGES_COSTEXPENSIVE,
+				getattr(plugin, "PAGE_PAGESIZE", 0), plugin.PAGE_LAYOUT, False,
+				getattr(plugin, "PAGE_BUDGET", ARGONEONPAGES_PLUGINBUDGET))
+			argoneonpages_pluginerrors.pop(pagename, None)
+			if pagename not in argoneonpages_pluginlist:
+				argoneonpages_pluginlist.append(pagename)
+			output.append(pagename)
+		except Exception as e:
+			argoneonpages_pluginerrors[pagename] = str(e)
+	return output
+
+
+# Sample history for the graph pages
+
+ARGONEONPAGES_HISTORYINTERVAL = 5	# Seconds per sample, a full width graph is about 10 mins
+
+# Fixed size ring buffer of samples
+class ArgonHistoryBuffer:
+	def __init__(self, size = OLED_WD):
+		self.size = size
+		self.samples = array.array("f", bytes(4*size))
+		# Total samples added, the next one goes to count % size
+		self.count = 0
+		self.lock = threading.Lock()
+
+	def add(self, value):
+		with self.lock:
+			self.samples[self.count % self.size] = value
+			self.count = self.count + 1
+
+	# Returns [total samples added, list of samples oldest first]
+	def getsamples(self):
+		with self.lock:
+			if self.count < self.size:
+				return [self.count, self.samples[0:self.count].tolist()]
+			idx = self.count % self.size
+			return [self.count, self.samples[idx:].tolist() + self.samples[0:idx].tolist()]
+
+argoneonpages_historylist = {"cpu": ArgonHistoryBuffer(), "temp": ArgonHistoryBuffer(), "network": ArgonHistoryBuffer(), "disk": ArgonHistoryBuffer()}
+
+# Timer task (see timer_loop in argononed), yields the seconds to the next sample
+# Network and disk are in bytes per second
+def argoneonpages_historytask():
+	prevcpu = argonsysinfo_getcpuusagesnapshot().get("cpu")
+	prevnetwork = argoneonpages_readcounter(argonsysinfo_getnetworkbytes)
+	prevdisk = argoneonpages_readcounter(argonsysinfo_getdiskbytes)
+	prevtime = time.monotonic()
+	while True:
+		yield ARGONEONPAGES_HISTORYINTERVAL
+		curtime = time.monotonic()
+		elapsed = curtime - prevtime
+		prevtime = curtime
+		if elapsed <= 0:
+			continue
+
+		curcpu = argonsysinfo_getcpuusagesnapshot().get("cpu")
+		if curcpu is not None and prevcpu is not None and curcpu["total"] > prevcpu["total"]:
+			total = curcpu["total"] - prevcpu["total"]
+			argoneonpages_historylist["cpu"].add(100*(total - (curcpu["idle"] - prevcpu["idle"]))/total)
+		prevcpu = curcpu
+
+		argoneonpages_historylist["temp"].add(argonsysinfo_gettemp())
+
+		curnetwork = argoneonpages_readcounter(argonsysinfo_getnetworkbytes)
+		if curnetwork >= 0 and prevnetwork >= 0 and curnetwork >= prevnetwork:
+			argoneonpages_historylist["network"].add((curnetwork - prevnetwork)/elapsed)
+		prevnetwork = curnetwork
+
+		curdisk = argoneonpages_readcounter(argonsysinfo_getdiskbytes)
+		if curdisk >= 0 and prevdisk >= 0 and curdisk >= prevdisk:
+			argoneonpages_historylist["disk"].add((curdisk - prevdisk)/elapsed)
+		prevdisk = curdisk
+
+def argoneonpages_readcounter(func):
+	try:
+		return func()
+	except Exception:
+		return -1
+
+def argoneonpages_kbpersecstr(bytespersec):
+	return argonsysinfo_kbstr(int(bytespersec)>>10)+"/s"
+
+def argoneonpages_tempstr(cval):
+	return str(round(cval, 1))+chr(167)+"C"
+
+# Graph pages, keyed by page name: history, title, min and max values (None to scale to the samples),
+# function to format the latest sample
+ARGONEONPAGES_GRAPHLIST = {
+	"cpugraph": {"history": "cpu", "title": "CPU", "minvalue": 0, "maxvalue": 100, "format": lambda value: str(int(value))+"%"},
+	"tempgraph": {"history": "temp", "title": "TEMP", "minvalue": 30, "maxvalue": 80, "format": argoneonpages_tempstr},
+	"netgraph": {"history": "network", "title": "NET", "minvalue": 0, "maxvalue": None, "format": argoneonpages_kbpersecstr},
+	"diskgraph": {"history": "disk", "title": "DISK", "minvalue": 0, "maxvalue": None, "format": argoneonpages_kbpersecstr}
+}
+
+# Smallest power of 2 (at least 1KB) above the samples, so the scale doesn't change on every sample
+def argoneonpages_getgraphscale(samplelist):
+	maxvalue = 1024
+	for cursample in samplelist:
+		while cursample > maxvalue:
+			maxvalue = maxvalue*2
+	return maxvalue
+
+def argoneonpages_graphvalues(pagename, historydata):
+	graphinfo = ARGONEONPAGES_GRAPHLIST[pagename]
+	samplelist = historydata[1]
+	if len(samplelist) == 0:
+		return {}
+	maxvalue = graphinfo["maxvalue"]
+	if maxvalue is None:
+		maxvalue = argoneonpages_getgraphscale(samplelist)
+	return {"value": graphinfo["format"](samplelist[-1]), "graph": [historydata[0], graphinfo["minvalue"], maxvalue, samplelist]}
+
+def argoneonpages_graphlayout(title):
+	return {"bg": "bgblack",
+		"labels": [argoneonpages_label(title, 0, 0, OLED_WD)],
+		"fields": [
+			argoneonpages_textfield("value", 0, 0, OLED_WD, 2),
+			{"name": "graph", "type": "graph", "x": 0, "y": 16, "wd": OLED_WD, "ht": OLED_HT-16}
+		]}
+
+def argoneonpages_addgraphpage(pagename):
+	graphinfo = ARGONEONPAGES_GRAPHLIST[pagename]
+	historybuffer = argoneonpages_historylist[graphinfo["history"]]
+	argoneonpages_addpage(pagename, historybuffer.getsamples, lambda historydata: argoneonpages_graphvalues(pagename, historydata),
+		ARGONEONPAGES_HISTORYINTERVAL, ARGONEONPAGES_COSTCHEAP, 0, argoneonpages_graphlayout(graphinfo["title"]))
+
+
+argoneonpages_addpage("clock", argoneonpages_getclockdata, argoneonpages_clockvalues, 60, ARGONEONPAGES_COSTCHEAP, 0, None, True)
+argoneonpages_addpage("cpu", argoneonpages_getcpudata, argoneonpages_cpuvalues, 5, ARGONEONPAGES_COSTCHEAP, 4)
+argoneonpages_addpage("storage", argoneonpages_getstoragedata, argoneonpages_storagevalues, 60, ARGONEONPAGES_COSTEXPENSIVE, 3)
+argoneonpages_addpage("raid", argoneonpages_getraiddata, argoneonpages_raidvalues, 60, ARGONEONPAGES_COSTEXPENSIVE, 1)
+argoneonpages_addpage("ram", argonsysinfo_getram, argoneonpages_ramvalues, 10)
+argoneonpages_addpage("temp", argonsysinfo_gettemp, argoneonpages_tempvalues, 5)
+argoneonpages_addpage("ip", argonsysinfo_getip, argoneonpages_ipvalues, 30)
+for curgraph in ARGONEONPAGES_GRAPHLIST:
+	argoneonpages_addgraphpage(curgraph)
@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+
+#
+# Shared OLED framebuffer, lets other programs draw on the OLED while argononed runs
+#
+# argononed creates a memory mapped file with a header and one framebuffer (SSD1306
+# page format, see argoneonoled). A client claims a region of the screen, or the whole
+# screen, draws with the oled_* functions and publishes the frame. argononed copies the
+# claimed region over its own page and sends the changed blocks, so the bus has one owner.
+#
+# Client:
+#   argoneonshared_connect()
+#   argoneonshared_claim(x, y, wd, ht, seconds) or argoneonshared_takeover(seconds)
+#   ... draw into the oled_imagebuffer ...
+#   argoneonshared_publish()
+#   argoneonshared_release()
+# Or set OledSharedBackend as the oled backend, each oled_flushimage is then published.
+#
+# Only one client can hold a claim, it's dropped when it expires or the client exits.
+# The file is locked (flock) while the header or frame is changed. The sequence is
+# incremented on each change, and clients write to a FIFO to wake up argononed.
+# The files are in a directory only root can write to, they're created again on each start.
+#
+
+import os
+import sys
+import time
+import mmap
+import fcntl
+import errno
+import struct
+import threading
+sys.path.append("/etc/argon/")
+from argoneonoled import *
+
+ARGONEONSHARED_DIR = "/run/argon/"
+ARGONEONSHARED_DIRMODE = 0o755
+ARGONEONSHARED_PATH = ARGONEONSHARED_DIR+"oled.fb"
+ARGONEONSHARED_NOTIFYPATH = ARGONEONSHARED_DIR+"oled.notify"
+# Clients need write access, so they have to run as root (connect raises PermissionError otherwise)
+ARGONEONSHARED_FILEMODE = 0o644
+
+ARGONEONSHARED_MAGIC = b"AOFB"
+# magic, sequence, owner pid, mode, x, y, wd, ht, expiry (time.monotonic, 0 if none)
+ARGONEONSHARED_HEADERFORMAT = "<4sIIBBBBBxxxd"
+ARGONEONSHARED_HEADERSIZE = 32
+ARGONEONSHARED_FILESIZE = ARGONEONSHARED_HEADERSIZE + OLED_BUFFERIZE
+
+ARGONEONSHARED_MODENONE = 0
+ARGONEONSHARED_MODEREGION = 1
+ARGONEONSHARED_MODETAKEOVER = 2
+
+argoneonshared_fd = -1
+argoneonshared_map = None
+# Set when this process created the files, they're removed on close
+argoneonshared_createflag = False
+# Last frame copied by argoneonshared_apply, [sequence, frame bytes]
+argoneonshared_lastframe = [-1, None]
+# FIFO read by argoneonshared_watch, -1 if none
+argoneonshared_watchfd = -1
+
+
+def argoneonshared_readheader():
+	return list(struct.unpack_from(ARGONEONSHARED_HEADERFORMAT, argoneonshared_map, 0))
+
+# Header read under a shared lock, so it's not torn by a client changing it
+def argoneonshared_readheaderlocked():
+	argoneonshared_lock(False)
+	try:
+		return argoneonshared_readheader()
+	finally:
+		argoneonshared_unlock()
+
+def argoneonshared_writeheader(header):
+	struct.pack_into(ARGONEONSHARED_HEADERFORMAT, argoneonshared_map, 0, *header)
+
+def argoneonshared_lock(exclusive = True):
+	fcntl.flock(argoneonshared_fd, fcntl.LOCK_EX if exclusive == True else fcntl.LOCK_SH)
+
+def argoneonshared_unlock():
+	fcntl.flock(argoneonshared_fd, fcntl.LOCK_UN)
+
+def argoneonshared_isowneralive(header):
+	if header[2] == 0 or header[3] == ARGONEONSHARED_MODENONE:
+		return False
+	if header[8] > 0 and time.monotonic() >= header[8]:
+		return False
+	try:
+		os.kill(header[2], 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		# Running as another user
+		pass
+	return True
+
+def argoneonshared_open(path, createflag):
+	global argoneonshared_fd, argoneonshared_map, argoneonshared_createflag
+	argoneonshared_close()
+	if createflag == True:
+		# Anything already there is replaced, and links aren't followed
+		argoneonshared_removefile(path)
+		fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, ARGONEONSHARED_FILEMODE)
+		os.ftruncate(fd, ARGONEONSHARED_FILESIZE)
+	else:
+		fd = os.open(path, os.O_RDWR)
+	try:
+		argoneonshared_map = mmap.mmap(fd, ARGONEONSHARED_FILESIZE)
+	except:
+		os.close(fd)
+		raise
+	argoneonshared_fd = fd
+	argoneonshared_createflag = createflag
+
+def argoneonshared_removefile(path):
+	try:
+		os.remove(path)
+	except FileNotFoundError:
+		pass
+
+
+# Service side
+
+def argoneonshared_create(path = ARGONEONSHARED_PATH, notifypath = ARGONEONSHARED_NOTIFYPATH):
+	global ARGONEONSHARED_PATH, ARGONEONSHARED_NOTIFYPATH
+	ARGONEONSHARED_PATH = path
+	ARGONEONSHARED_NOTIFYPATH = notifypath
+	for dirname in [os.path.dirname(path), os.path.dirname(notifypath)]:
+		os.makedirs(dirname, ARGONEONSHARED_DIRMODE, exist_ok=True)
+	argoneonshared_open(path, True)
+	argoneonshared_writeheader([ARGONEONSHARED_MAGIC, 0, 0, ARGONEONSHARED_MODENONE, 0, 0, 0, 0, 0])
+	argoneonshared_removefile(notifypath)
+	os.mkfifo(notifypath, ARGONEONSHARED_FILEMODE)
+
+def argoneonshared_close():
+	global argoneonshared_fd, argoneonshared_map, argoneonshared_createflag, argoneonshared_watchfd
+	if argoneonshared_watchfd >= 0:
+		# Wakes up the watch thread, which closes the FIFO
+		fd = argoneonshared_watchfd
+		argoneonshared_watchfd = -1
+		try:
+			os.write(fd, b"\0")
+		except OSError:
+			pass
+	if argoneonshared_map is not None:
+		argoneonshared_map.close()
+		argoneonshared_map = None
+	if argoneonshared_fd >= 0:
+		os.close(argoneonshared_fd)
+		argoneonshared_fd = -1
+	if argoneonshared_createflag == True:
+		for fname in [ARGONEONSHARED_PATH, ARGONEONSHARED_NOTIFYPATH]:
+			try:
+				argoneonshared_removefile(fname)
+			except OSError:
+				pass
+		argoneonshared_createflag = False
+	argoneonshared_lastframe[:] = [-1, None]
+
+# Calls func() from a background thread each time a client writes to the FIFO
+# The thread ends after argoneonshared_close
+def argoneonshared_watch(func):
+	global argoneonshared_watchfd
+	# Opened read/write so it doesn't see end of file when a client closes it
+	fd = os.open(ARGONEONSHARED_NOTIFYPATH, os.O_RDWR | os.O_NOFOLLOW)
+	argoneonshared_watchfd = fd
+	def watchloop():
+		try:
+			while True:
+				if len(os.read(fd, 64)) == 0 or argoneonshared_watchfd != fd:
+					return
+				func()
+		except OSError:
+			return
+		finally:
+			os.close(fd)
+	watchthread = threading.Thread(target=watchloop, daemon=True)
+	watchthread.start()
+
+# Returns the header if a client holds a claim, None otherwise
+# Expired claims and claims of processes that exited are dropped
+def argoneonshared_getclient():
+	if argoneonshared_map is None:
+		return None
+	header = argoneonshared_readheaderlocked()
+	if header[3] == ARGONEONSHARED_MODENONE:
+		return None
+	if argoneonshared_isowneralive(header) == True:
+		return header
+	argoneonshared_lock()
+	try:
+		header = argoneonshared_readheader()
+		if argoneonshared_isowneralive(header) == True:
+			return header
+		if header[3] != ARGONEONSHARED_MODENONE:
+			header[1] = (header[1] + 1) & 0xFFFFFFFF
+			header[2] = 0
+			header[3] = ARGONEONSHARED_MODENONE
+			argoneonshared_writeheader(header)
+	finally:
+		argoneonshared_unlock()
+	return None
+
+def argoneonshared_isactive():
+	return argoneonshared_getclient() is not None
+
+# Seconds until the claim expires, None if there's no claim or it doesn't expire
+def argoneonshared_getwait():
+	header = argoneonshared_getclient()
+	if header is None or header[8] <= 0:
+		return None
+	return header[8] - time.monotonic()
+
+# Draws the client's region over the framebuffer, returns True if there's a client
+def argoneonshared_apply():
+	header = argoneonshared_getclient()
+	if header is None:
+		return False
+	if argoneonshared_lastframe[0] != header[1]:
+		argoneonshared_lock(False)
+		try:
+			header = argoneonshared_readheader()
+			framebytes = bytes(argoneonshared_map[ARGONEONSHARED_HEADERSIZE:ARGONEONSHARED_FILESIZE])
+		finally:
+			argoneonshared_unlock()
+		if header[3] == ARGONEONSHARED_MODENONE:
+			# Released in the meantime
+			return False
+		argoneonshared_lastframe[:] = [header[1], framebytes]
+	if header[3] == ARGONEONSHARED_MODETAKEOVER:
+		oled_setbuffer(argoneonshared_lastframe[1])
+	else:
+		oled_copyregion(argoneonshared_lastframe[1], header[4], header[5], header[6], header[7])
+	return True
+
+
+# Client side
+
+# Raises FileNotFoundError if argononed isn't running with the OLED enabled,
+# PermissionError if not run as root
+def argoneonshared_connect(path = ARGONEONSHARED_PATH, notifypath = ARGONEONSHARED_NOTIFYPATH):
+	global ARGONEONSHARED_NOTIFYPATH
+	ARGONEONSHARED_NOTIFYPATH = notifypath
+	argoneonshared_open(path, False)
+	if argoneonshared_readheader()[0] != ARGONEONSHARED_MAGIC:
+		argoneonshared_close()
+		raise IOError("Not an OLED framebuffer: "+path)
+
+# Wakes up argononed, nothing to do if it isn't reading
+def argoneonshared_notify():
+	try:
+		fd = os.open(ARGONEONSHARED_NOTIFYPATH, os.O_WRONLY | os.O_NONBLOCK)
+	except OSError:
+		return
+	try:
+		os.write(fd, b"\0")
+	except OSError as e:
+		# Full FIFO, argononed has wake ups pending anyway
+		if e.errno != errno.EAGAIN:
+			raise
+	finally:
+		os.close(fd)
+
+# Claims the region for this process, seconds is 0 to keep it until released
+# Raises IOError if another process holds a claim
+def argoneonshared_claim(x, y, wd, ht, seconds = 0, mode = ARGONEONSHARED_MODEREGION):
+	expiry = 0
+	if seconds > 0:
+		expiry = time.monotonic() + seconds
+	argoneonshared_lock()
+	try:
+		header = argoneonshared_readheader()
+		if header[2] != os.getpid() and argoneonshared_isowneralive(header) == True:
+			raise IOError("OLED in use by process "+str(header[2]))
+		header[1] = (header[1] + 1) & 0xFFFFFFFF
+		header[2:] = [os.getpid(), mode, x, y, wd, ht, expiry]
+		argoneonshared_writeheader(header)
+	finally:
+		argoneonshared_unlock()
+
+def argoneonshared_takeover(seconds = 0):
+	argoneonshared_claim(0, 0, OLED_WD, OLED_HT, seconds, ARGONEONSHARED_MODETAKEOVER)
+
+# Copies the frame (oled_imagebuffer by default) to the shared framebuffer
+def argoneonshared_publish(framebytes = None):
+	if framebytes is None:
+		framebytes = oled_imagebuffer
+	argoneonshared_lock()
+	try:
+		header = argoneonshared_readheader()
+		if header[2] != os.getpid() or header[3] == ARGONEONSHARED_MODENONE:
+			raise IOError("OLED not claimed")
+		argoneonshared_map[ARGONEONSHARED_HEADERSIZE:ARGONEONSHARED_FILESIZE] = framebytes
+		header[1] = (header[1] + 1) & 0xFFFFFFFF
+		argoneonshared_writeheader(header)
+	finally:
+		argoneonshared_unlock()
+	argoneonshared_notify()
+
+def argoneonshared_release():
+	argoneonshared_lock()
+	try:
+		header = argoneonshared_readheader()
+		if header[2] == os.getpid():
+			header[1] = (header[1] + 1) & 0xFFFFFFFF
+			header[2] = 0
+			header[3] = ARGONEONSHARED_MODENONE
+			argoneonshared_writeheader(header)
+	finally:
+		argoneonshared_unlock()
+	argoneonshared_notify()
+
+# oled backend for clients, frames go to the shared framebuffer instead of the panel
+class OledSharedBackend(OledMemoryBackend):
+	def endframe(self):
+		OledMemoryBackend.endframe(self)
+		argoneonshared_publish(self.gddram)
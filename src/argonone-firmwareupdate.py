@@ -3,8 +3,7 @@
 import urllib.request
 
 import time
-import smbus
-import RPi.GPIO as GPIO
+import sys
 
 import serial
 import os.path
@@ -141,11 +140,8 @@ def writePacketBytes(packet, offset, bytedata, length):
 		idx = idx + 1
 
 # i2c bus
-rev = GPIO.RPI_REVISION
-if rev == 2 or rev == 3:
-	bus = smbus.SMBus(1)
-else:
-	bus = smbus.SMBus(0)
+sys.path.append("/etc/argon/")
+from argonbus import *
 
 if os.path.isfile(firmwarefile) == False or ALWAYSDOWNLOAD == True:
 	print("Downloading Firmware ...")
@@ -156,8 +152,9 @@ if os.path.isfile(firmwarefile) == False or ALWAYSDOWNLOAD == True:
 print("Preparing device...")
 attemptcounter = 0
 # Send update command to i2c
+# No retries, write failing is how we detect that the MCU is in update mode
 try:
-	bus.write_byte(I2CADDRESS,I2CCOMMAND)
+	argonbus_writebyte(I2CADDRESS,I2CCOMMAND, ARGONBUS_PRIORITY_POWER, 0)
 except:
 	# Error at first attempt, I2C communication error
 	print("Communication Failed.")
@@ -166,7 +163,7 @@ except:
 while attemptcounter<3:
 	try:
 		time.sleep(1)
-		bus.write_byte(I2CADDRESS,I2CCOMMAND)
+		argonbus_writebyte(I2CADDRESS,I2CCOMMAND, ARGONBUS_PRIORITY_POWER, 0)
 		attemptcounter = attemptcounter + 1
 	except:
 		# I2C command failed, MCU in update mode
@@ -174,7 +171,7 @@ while attemptcounter<3:
 		attemptcounter = 5
 
 try:
-	bus.close()
+	argonbus_close()
 except:
 	print("Communication Failure.")
 
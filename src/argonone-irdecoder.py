@@ -2,7 +2,6 @@
 
 # Standard Headers
 import sys
-import smbus
 import RPi.GPIO as GPIO
 
 # For GPIO
@@ -419,14 +418,11 @@ if len(powerdata) > 0 and readaborted == False:
 	#print("Writing " + getbytestring(powerdata))
 	print("Updating Device...")
 
-	rev = GPIO.RPI_REVISION
-	if rev == 2 or rev == 3:
-		bus = smbus.SMBus(1)
-	else:
-		bus = smbus.SMBus(0)
+	sys.path.append("/etc/argon/")
+	from argonbus import *
 
-	bus.write_i2c_block_data(address, command, powerdata)
-	bus.close()
+	argonbus_writeblockdata(address, command, powerdata, ARGONBUS_PRIORITY_POWER)
+	argonbus_close()
 
 	# Update IR Conf if there are other button
 	if buttonidx > 1:
@@ -26,19 +26,14 @@ import RPi.GPIO as GPIO
 import sys
 import os
 import time
+import sched
 from threading import Thread
-from queue import Queue
+from queue import Queue, Empty
 
 sys.path.append("/etc/argon/")
 from argonsysinfo import *
-# Initialize I2C Bus
-import smbus
-
-rev = GPIO.RPI_REVISION
-if rev == 2 or rev == 3:
-	bus=smbus.SMBus(1)
-else:
-	bus=smbus.SMBus(0)
+# Shared I2C Bus
+from argonbus import *
 
 
 OLED_ENABLED=False
@@ -46,10 +41,22 @@ OLED_ENABLED=False
 if os.path.exists("/etc/argon/argoneonoled.py"):
 	import datetime
 	from argoneonoled import *
+	from argoneonpages import *
+	from argoneonshared import *
 	OLED_ENABLED=True
 
 OLED_CONFIGFILE = "/etc/argoneonoled.conf"
 
+# Time of the last page switch button event, to measure how long it takes to show the page
+display_buttontime = 0
+display_latencystats = {"count": 0, "totaltime": 0.0, "maxtime": 0.0}
+
+# RTC scheduler is only hosted here in combined mode (EONSERVICE)
+RTC_ENABLED=False
+
+if os.path.exists("/etc/argon/argoneond.py"):
+	RTC_ENABLED=True
+
 ADDR_FAN=0x1a
 PIN_SHUTDOWN=4
 
@@ -62,6 +69,7 @@ GPIO.setup(PIN_SHUTDOWN, GPIO.IN,  pull_up_down=GPIO.PUD_DOWN)
 # The pulse width is measured, and the corresponding shell command will be issued
 
 def shutdown_check(writeq):
+	global display_buttontime
 	while True:
 		pulsetime = 1
 		GPIO.wait_for_edge(PIN_SHUTDOWN, GPIO.RISING)
@@ -78,6 +86,7 @@ def shutdown_check(writeq):
 			writeq.put("OLEDSTOP")
 			os.system("shutdown now -h")
 		elif pulsetime >=6 and pulsetime <=7:
+			display_buttontime = time.monotonic()
 			writeq.put("OLEDSWITCH")
 
 # This function converts the corresponding fanspeed for the given temperature
@@ -160,13 +169,16 @@ def load_oledconfig(fname):
 					output['screenlist']=tmppair[1].replace("\"", "").split(" ")
 				elif tmppair[0] == "enabled":
 					output['enabled']=tmppair[1].replace("\"", "")
+				elif tmppair[0] == "scrollrate":
+					output['scrollrate']=int(tmppair[1])
 	except:
 		return {}
 	return output
 
-# This function is the thread that monitors temperature and sets the fan speed
+# This function is the task that monitors temperature and sets the fan speed
 # The value is fed to get_fanspeed to get the new fan speed
 # To prevent unnecessary fluctuations, lowering fan speed is delayed by 30 seconds
+# It yields the number of seconds to wait instead of sleeping, see timer_loop
 #
 # Location of config file varies based on OS
 #
@@ -181,42 +193,68 @@ def temp_check():
 		newspeed = get_fanspeed(val, fanconfig)
 		if newspeed < prevspeed:
 			# Pause 30s if reduce to prevent fluctuations
-			time.sleep(30)
+			yield 30
 		prevspeed = newspeed
 		try:
 			if newspeed > 0:
 				# Spin up to prevent issues on older units
-				bus.write_byte(ADDR_FAN,100)
-				time.sleep(1)
-			bus.write_byte(ADDR_FAN,newspeed)
-			time.sleep(30)
+				argonbus_writebyte(ADDR_FAN,100, ARGONBUS_PRIORITY_FAN)
+				yield 1
+			argonbus_writebyte(ADDR_FAN,newspeed, ARGONBUS_PRIORITY_FAN)
+			yield 30
 		except IOError:
-			time.sleep(60)
+			yield 60
+
+# This function is the thread that runs the periodic tasks (fan, RTC) on one shared timer
+# Each task is a generator that yields the number of seconds until it should resume,
+# so the tasks don't need a thread (and stack) each
+# The list has the generator functions, a task that fails is restarted after TIMER_RETRYSEC
+# so it doesn't stop the other tasks
+
+TIMER_RETRYSEC = 60
+
+def timer_loop(taskfunclist):
+	timerwheel = sched.scheduler(time.monotonic, time.sleep)
+	for curfunc in taskfunclist:
+		timerwheel.enter(0, 0, timer_runtask, (timerwheel, curfunc, None))
+	timerwheel.run()
+
+def timer_runtask(timerwheel, curfunc, curtask):
+	try:
+		if curtask is None:
+			curtask = curfunc()
+		waitsec = next(curtask)
+	except StopIteration:
+		return
+	except Exception as e:
+		print("Task "+curfunc.__name__+" failed, restarting in "+str(TIMER_RETRYSEC)+"s:", repr(e), flush=True)
+		timerwheel.enter(TIMER_RETRYSEC, 0, timer_runtask, (timerwheel, curfunc, None))
+		return
+	timerwheel.enter(waitsec, 0, timer_runtask, (timerwheel, curfunc, curtask))
 
 #
 # This function is the thread that updates OLED
+# Page layouts and data providers are in argoneonpages
+# A page is redrawn when its provider has new data, only the changed fields are drawn
 #
 def display_loop(readq):
-	weekdaynamelist = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"] 
-	monthlist = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"] 
-	oledscreenwidth = oled_getmaxX()
-
-	fontwdSml = 6	# Maps to 6x8
-	fontwdReg = 8	# Maps to 8x16
-	stdleftoffset = 54
-
+	global display_buttontime
 	screensavermode = False
-	screensaversec = 120
-	screensaverctr = 0
+	screensaversec = 120		# 0 if disabled
+	screensaverstarttime = time.monotonic()
+	pagestarttime = screensaverstarttime
 
 	screenenabled = ["clock", "ip"]
-	prevscreen = ""
 	curscreen = ""
 	screenid = 0
 	screenjogtime = 0
-	screenjogflag = 0	# start with screenid 0
-	cpuusagelist = []
-	curlist = []
+	screenlist = []		# Page data split into screens
+	screenpos = 0
+	loadflag = True
+	dataversion = 0
+	failctr = 0
+	switchtime = 0		# Button event not shown yet
+	sharedflag = False	# Frame has the region of a shared framebuffer client
 
 	tmpconfig=load_oledconfig(OLED_CONFIGFILE)
 
@@ -226,248 +264,173 @@ def display_loop(readq):
 		screenjogtime = tmpconfig["screenduration"]
 	if "screenlist" in tmpconfig:
 		screenenabled = tmpconfig["screenlist"]
+	if "scrollrate" in tmpconfig:
+		argoneonpages_setscrollrate(tmpconfig["scrollrate"])
 
 	if "enabled" in tmpconfig:
 		if tmpconfig["enabled"] == "N":
 			screenenabled = []
 
-	while len(screenenabled) > 0:
-		if len(curlist) == 0 and screenjogflag == 1:
-			# Reset Screen Saver
-			screensavermode = False
-			screensaverctr = 0
-
-			# Update screen info
-			screenid = screenid + screenjogflag
-			if screenid >= len(screenenabled):
-				screenid = 0
-		prevscreen = curscreen
-		curscreen = screenenabled[screenid]
-
-		if screenjogtime == 0:
-			# Resets jogflag (if switched manually)
-			screenjogflag = 0
-		else:
-			screenjogflag = 1
+	# Custom pages from /etc/argon/pages.d/
+	argoneonpages_loadplugins()
 
-		needsUpdate = False
-		if curscreen == "cpu":
-			# CPU Usage
-			if len(curlist) == 0:
-				try:
-					if len(cpuusagelist) == 0:
-						cpuusagelist = argonsysinfo_listcpuusage()
-					curlist = cpuusagelist
-				except:
-					curlist = []
-			if len(curlist) > 0:
-				oled_loadbg("bgcpu")
-
-				# Display List
-				yoffset = 0
-				tmpmax = 4
-				while tmpmax > 0 and len(curlist) > 0:
-					curline = ""
-					tmpitem = curlist.pop(0)
-					curline = tmpitem["title"]+": "+str(tmpitem["value"])+"%"
-					oled_writetext(curline, stdleftoffset, yoffset, fontwdSml)
-					oled_drawfilledrectangle(stdleftoffset, yoffset+12, int((oledscreenwidth-stdleftoffset-4)*tmpitem["value"]/100), 2)
-					tmpmax = tmpmax - 1
-					yoffset = yoffset + 16
-
-				needsUpdate = True
-			else:
-				# Next page due to error/no data
-				screenjogflag = 1
-		elif curscreen == "storage":
-			# Storage Info
-			if len(curlist) == 0:
-				try:
-					tmpobj = argonsysinfo_listhddusage()
-					for curdev in tmpobj:
-						curlist.append({"title": curdev, "value": argonsysinfo_kbstr(tmpobj[curdev]['total']), "usage": int(100*tmpobj[curdev]['used']/tmpobj[curdev]['total']) })
-					#curlist = argonsysinfo_liststoragetotal()
-				except:
-					curlist = []
-			if len(curlist) > 0:
-				oled_loadbg("bgstorage")
-				
-				yoffset = 16
-				tmpmax = 3
-				while tmpmax > 0 and len(curlist) > 0:
-					tmpitem = curlist.pop(0)
-					# Right column first, safer to overwrite white space
-					oled_writetextaligned(tmpitem["value"], 77, yoffset, oledscreenwidth-77, 2, fontwdSml)
-					oled_writetextaligned(str(tmpitem["usage"])+"%", 50, yoffset, 74-50, 2, fontwdSml)
-					tmpname = tmpitem["title"]
-					if len(tmpname) > 8:
-						tmpname = tmpname[0:8]
-					oled_writetext(tmpname, 0, yoffset, fontwdSml)
-					
-					tmpmax = tmpmax - 1
-					yoffset = yoffset + 16
-				needsUpdate = True
-			else:
-				# Next page due to error/no data
-				screenjogflag = 1
-
-		elif curscreen == "raid":
-			# Raid Info
-			if len(curlist) == 0:
-				try:
-					tmpobj = argonsysinfo_listraid()
-					curlist = tmpobj['raidlist']
-				except:
-					curlist = []
-			if len(curlist) > 0:
-				oled_loadbg("bgraid")
-				tmpitem = curlist.pop(0)
-				oled_writetextaligned(tmpitem["title"], 0, 0, stdleftoffset, 1, fontwdSml)
-				oled_writetextaligned(tmpitem["value"], 0, 8, stdleftoffset, 1, fontwdSml)
-				oled_writetextaligned(argonsysinfo_kbstr(tmpitem["info"]["size"]), 0, 56, stdleftoffset, 1, fontwdSml)
-
-				oled_writetext("Used:"+argonsysinfo_kbstr(tmpitem["info"]["used"]), stdleftoffset, 8, fontwdSml)
-				oled_writetext("      "+str(int(100*tmpitem["info"]["used"]/tmpitem["info"]["size"]))+"%", stdleftoffset, 16, fontwdSml)
-				oled_writetext("Active:"+str(int(tmpitem["info"]["active"]))+"/"+str(int(tmpitem["info"]["devices"])), stdleftoffset, 32, fontwdSml)
-				oled_writetext("Working:"+str(int(tmpitem["info"]["working"]))+"/"+str(int(tmpitem["info"]["devices"])), stdleftoffset, 40, fontwdSml)
-				oled_writetext("Failed:"+str(int(tmpitem["info"]["failed"]))+"/"+str(int(tmpitem["info"]["devices"])), stdleftoffset, 48, fontwdSml)
-				needsUpdate = True
-			else:
-				# Next page due to error/no data
-				screenjogflag = 1
+	# Wake up when expensive data for the current page is loaded
+	argoneonpages_setnotify(lambda pagename: readq.put("OLEDDATA"))
+	argoneonpages_refreshproviders(screenenabled)
 
-		elif curscreen == "ram":
-			# RAM
-			try:
-				oled_loadbg("bgram")
-				tmpraminfo = argonsysinfo_getram()
-				oled_writetextaligned(tmpraminfo[0], stdleftoffset, 8, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-				oled_writetextaligned("of", stdleftoffset, 24, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-				oled_writetextaligned(tmpraminfo[1], stdleftoffset, 40, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-				needsUpdate = True
-			except:
-				needsUpdate = False
-				# Next page due to error/no data
-				screenjogflag = 1
-		elif curscreen == "temp":
-			# Temp
-			try:
-				maxht = 21
-				oled_loadbg("bgtemp")
-				cval = argonsysinfo_gettemp()
-				fval = 32+9*cval/5
-
-				# 40C is min, 80C is max
-				barht = int(maxht*(cval-40)/40)
-				if barht > maxht:
-					barht = maxht
-				elif barht < 1:
-					barht = 1
-
-				tmpcstr = str(cval)
-				if len(tmpcstr) > 4:
-					tmpcstr = tmpcstr[0:4]
-				tmpfstr = str(fval)
-				if len(tmpfstr) > 5:
-					tmpfstr = tmpfstr[0:5]
-
-				oled_writetextaligned(tmpcstr+ chr(167) +"C", stdleftoffset, 16, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-				oled_writetextaligned(tmpfstr+ chr(167) +"F", stdleftoffset, 32, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-
-				oled_drawfilledrectangle(24, 20+(maxht-barht), 3, barht, 2)
+	# Other programs can draw through the shared framebuffer, see argoneonshared
+	try:
+		argoneonshared_create()
+		argoneonshared_watch(lambda: readq.put("OLEDSHARED"))
+	except OSError:
+		argoneonshared_close()
 
-				needsUpdate = True
-			except:
-				needsUpdate = False
-				# Next page due to error/no data
-				screenjogflag = 1
-		elif curscreen == "ip":
-			# IP Address
-			try:
-				oled_loadbg("bgip")
-				oled_writetextaligned(argonsysinfo_getip(), 0, 8, oledscreenwidth, 1, fontwdReg)
-				needsUpdate = True
-			except:
-				needsUpdate = False
-				# Next page due to error/no data
-				screenjogflag = 1
-		else:
-			try:
-				oled_loadbg("bgtime")
-				# Date and Time HH:MM
-				curtime = datetime.datetime.now()
-
-				# Month/Day
-				outstr = str(curtime.day).strip()
-				if len(outstr) < 2:
-					outstr = " "+outstr
-				outstr = monthlist[curtime.month-1]+outstr
-				oled_writetextaligned(outstr, stdleftoffset, 8, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-
-				# Day of Week
-				oled_writetextaligned(weekdaynamelist[curtime.weekday()], stdleftoffset, 24, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-				
-				# Time
-				outstr = str(curtime.minute).strip()
-				if len(outstr) < 2:
-					outstr = "0"+outstr
-				outstr = str(curtime.hour)+":"+outstr
-				if len(outstr) < 5:
-					outstr = "0"+outstr
-				oled_writetextaligned(outstr, stdleftoffset, 40, oledscreenwidth-stdleftoffset, 1, fontwdReg)
+	while len(screenenabled) > 0:
+		curscreen = screenenabled[screenid]
+		pagename = curscreen
+		if argoneonpages_haspage(pagename) == False:
+			pagename = "clock"
 
+		needsUpdate = False
+		try:
+			if loadflag == True:
+				# Cached data, only cheap providers are called here
+				loadflag = False
+				pagedata, dataversion = argoneonpages_getdata(pagename)
+				screenlist = argoneonpages_getscreens(pagename, pagedata)
+				if screenpos >= len(screenlist):
+					screenpos = 0
+			if screenpos < len(screenlist):
+				argoneonpages_renderscreen(pagename, screenlist[screenpos])
 				needsUpdate = True
-			except:
-				needsUpdate = False
-				# Next page due to error/no data
-				screenjogflag = 1
-
-		if needsUpdate == True:
+		except:
+			needsUpdate = False
+
+		if needsUpdate == False:
+			# Next page due to error/no data
+			screenid = (screenid + 1) % len(screenenabled)
+			screenpos = 0
+			loadflag = True
+			pagestarttime = time.monotonic()
+			failctr = failctr + 1
+			if failctr >= len(screenenabled):
+				# No page has data, wait for the providers
+				failctr = 0
+				time.sleep(1)
+				argoneonpages_refreshproviders(screenenabled)
+			continue
+		failctr = 0
+
+		sharedflag = argoneonshared_apply()
+		if screensavermode == False:
+			# Update screen if not screen saver mode
+			# Only changed blocks are sent, no need to hide the screen on page change
+			oled_swapbuffers()
+			oled_power(True)
+			if switchtime > 0:
+				display_addlatency(time.monotonic() - switchtime)
+				switchtime = 0
+
+		# Sleep until the next deadline (page switch, screensaver, data refresh, scrolling text) or a queue event
+		# Page duration isn't reset when redrawing new data
+		# In screen saver mode only a button event wakes the thread
+		switchflag = False
+		while True:
+			curtime = time.monotonic()
+			waitsec = None
 			if screensavermode == False:
-				# Update screen if not screen saver mode
-				oled_power(True)
-				oled_flushimage(prevscreen != curscreen)
-				oled_reset()
-
-			timeoutcounter = 0
-			while timeoutcounter<screenjogtime or screenjogtime == 0:
-				qdata = ""
-				if readq.empty() == False:
+				if screenjogtime > 0:
+					waitsec = pagestarttime + screenjogtime - curtime
+				if screensaversec > 0:
+					waitsec = display_minwait(waitsec, screensaverstarttime + screensaversec - curtime)
+				waitsec = display_minwait(waitsec, argoneonpages_getrefreshwait(screenenabled, pagename))
+				waitsec = display_minwait(waitsec, argoneonpages_getscrollwait(pagename))
+			waitsec = display_minwait(waitsec, argoneonshared_getwait())
+
+			qdata = ""
+			try:
+				if waitsec is None:
 					qdata = readq.get()
+				elif waitsec > 0:
+					qdata = readq.get(timeout=waitsec)
+			except Empty:
+				qdata = ""
 
-				if qdata == "OLEDSWITCH":
-					# Trigger screen switch
-					screenjogflag = 1
-					# Reset Screen Saver
+			if qdata == "OLEDSWITCH":
+				# Trigger screen switch
+				switchflag = True
+				switchtime = display_buttontime
+				display_buttontime = 0
+				# Reset Screen Saver
+				screensavermode = False
+				screensaverstarttime = time.monotonic()
+				break
+			elif qdata == "OLEDSHARED":
+				# Client frame changed, the screen stays on while a client draws
+				if argoneonshared_isactive() == True:
 					screensavermode = False
-					screensaverctr = 0
-
+					screensaverstarttime = time.monotonic()
+				break
+			elif qdata == "OLEDSTOP":
+				# End OLED Thread
+				argoneonpages_stopproviders()
+				argoneonshared_close()
+				display_defaultimg()
+				return
+
+			curtime = time.monotonic()
+			if screensavermode == False and screensaversec > 0 and curtime - screensaverstarttime >= screensaversec:
+				screensavermode = True
+				oled_clearbuffer()
+				oled_swapbuffers()
+				oled_power(False)
+			if screensavermode == False and screenjogtime > 0 and curtime - pagestarttime >= screenjogtime:
+				switchflag = True
+				break
+			if screensavermode == False:
+				# Expensive data is loaded ahead of time for all pages
+				argoneonpages_refreshproviders(screenenabled, pagename)
+				if argoneonpages_getversion(pagename) != dataversion:
+					# Redraw on new data
+					loadflag = True
+					break
+				if sharedflag == True or argoneonshared_isactive() == True:
+					# Page is redrawn under the client's region, or without it once the claim expired
 					break
-				elif qdata == "OLEDSTOP":
-					# End OLED Thread
-					display_defaultimg()
-					return
-				else:
-					screensaverctr = screensaverctr + 1
-					if screensaversec <= screensaverctr and screensavermode == False:
-						screensavermode = True
-						oled_fill(0)
-						oled_reset()
-						oled_power(False)
-
-					if timeoutcounter == 0:
-						# Use 1 sec sleep get CPU usage
-						cpuusagelist = argonsysinfo_listcpuusage(1)
-					else:
-						time.sleep(1)
-
-					timeoutcounter = timeoutcounter + 1
-					if timeoutcounter >= 60 and screensavermode == False:
-						# Refresh data every minute, unless screensaver got triggered
-						screenjogflag = 0
-						break
+				if argoneonpages_tickscroll(pagename) == True:
+					oled_swapbuffers()
+
+		if switchflag == True:
+			pagestarttime = time.monotonic()
+			# Next screen of the page, or next page
+			screenpos = screenpos + 1
+			if screenpos >= len(screenlist):
+				screenid = (screenid + 1) % len(screenenabled)
+				screenpos = 0
+				loadflag = True
+				# Reset Screen Saver
+				screensavermode = False
+				screensaverstarttime = pagestarttime
+	argoneonpages_stopproviders()
+	argoneonshared_close()
 	display_defaultimg()
 
+# Button to screen time, logged to the service output
+def display_addlatency(elapsed):
+	display_latencystats["count"] = display_latencystats["count"] + 1
+	display_latencystats["totaltime"] = display_latencystats["totaltime"] + elapsed
+	if elapsed > display_latencystats["maxtime"]:
+		display_latencystats["maxtime"] = elapsed
+	print("OLED page switch in {:.1f}ms (avg {:.1f}ms, max {:.1f}ms, {} switches)".format(1000*elapsed, 1000*display_latencystats["totaltime"]/display_latencystats["count"], 1000*display_latencystats["maxtime"], display_latencystats["count"]), flush=True)
+
+# Smaller wait time, None means no deadline
+def display_minwait(waitsec, newwaitsec):
+	if newwaitsec is None:
+		return waitsec
+	elif waitsec is None or newwaitsec < waitsec:
+		return newwaitsec
+	return waitsec
+
 def display_defaultimg():
 	# Load default image
 	#oled_power(True)
@@ -480,22 +443,32 @@ if len(sys.argv) > 1:
 	cmd = sys.argv[1].upper()
 	if cmd == "SHUTDOWN":
 		# Signal poweroff
-		bus.write_byte(ADDR_FAN,0xFF)
+		argonbus_writebyte(ADDR_FAN,0xFF, ARGONBUS_PRIORITY_POWER)
 
 		
 	elif cmd == "FANOFF":
 		# Turn off fan
-		bus.write_byte(ADDR_FAN,0)
+		argonbus_writebyte(ADDR_FAN,0, ARGONBUS_PRIORITY_FAN)
 		if OLED_ENABLED == True:
 			display_defaultimg()
 
-	elif cmd == "SERVICE":
+	elif cmd == "SERVICE" or cmd == "EONSERVICE":
 		# Starts the power button and temperature monitor threads
+		# EONSERVICE also hosts the RTC scheduler, replacing argoneond.service
 		try:
+			timertasklist = [temp_check]
+			if cmd == "EONSERVICE" and RTC_ENABLED == True:
+				# Bus is shared through argonbus
+				import argoneond
+				timertasklist.append(argoneond.rtcSharedServiceLoop)
+			if OLED_ENABLED == True:
+				# History for the graph pages
+				timertasklist.append(argoneonpages_historytask)
+
 			ipcq = Queue()
 			t1 = Thread(target = shutdown_check, args =(ipcq, ))
 
-			t2 = Thread(target = temp_check)
+			t2 = Thread(target = timer_loop, args =(timertasklist, ))
 			if OLED_ENABLED == True:
 				t3 = Thread(target = display_loop, args =(ipcq, ))
 
@@ -9,16 +9,19 @@ import time
 import socket
 
 def argonsysinfo_listcpuusage(sleepsec = 1):
-	outputlist = []
 	curusage_a = argonsysinfo_getcpuusagesnapshot()
 	time.sleep(sleepsec)
 	curusage_b = argonsysinfo_getcpuusagesnapshot()
+	return argonsysinfo_getcpuusage(curusage_a, curusage_b)
 
+# Usage between two snapshots from argonsysinfo_getcpuusagesnapshot, doesn't need to sleep
+def argonsysinfo_getcpuusage(curusage_a, curusage_b):
+	outputlist = []
 	for cpuname in curusage_a:
-		if cpuname == "cpu":
+		if cpuname == "cpu" or cpuname not in curusage_b:
 			continue
 		if curusage_a[cpuname]["total"] == curusage_b[cpuname]["total"]:
-			outputlist.append({"title": cpuname, "value": "0%"})
+			outputlist.append({"title": cpuname, "value": 0})
 		else:
 			total = curusage_b[cpuname]["total"]-curusage_a[cpuname]["total"]
 			idle = curusage_b[cpuname]["idle"]-curusage_a[cpuname]["idle"]
@@ -139,6 +142,42 @@ def argonsysinfo_gettemp():
 	cval = val/1000
 	fval = 32+9*val/5000
 
+# Total bytes received and sent on all interfaces except loopback
+def argonsysinfo_getnetworkbytes():
+	total = 0
+	tempfp = open("/proc/net/dev", "r")
+	alllines = tempfp.readlines()
+	tempfp.close()
+	for temp in alllines:
+		tmpidx = temp.find(":")
+		if tmpidx < 0:
+			continue
+		if temp[0:tmpidx].strip() == "lo":
+			continue
+		infolist = temp[tmpidx+1:].split()
+		if len(infolist) >= 9:
+			total = total + int(infolist[0]) + int(infolist[8])
+	return total
+
+# Total bytes read and written on whole disks, partitions and md/dm devices are not counted twice
+def argonsysinfo_getdiskbytes():
+	total = 0
+	tempfp = open("/proc/diskstats", "r")
+	alllines = tempfp.readlines()
+	tempfp.close()
+	for temp in alllines:
+		infolist = temp.split()
+		if len(infolist) < 10:
+			continue
+		devname = infolist[2]
+		if devname[0:4] in ["loop", "zram"] or devname[0:3] in ["ram", "dm-"] or devname[0:2] == "md":
+			continue
+		if os.path.exists("/sys/block/"+devname) == False:
+			continue
+		# Sectors are always 512 bytes here
+		total = total + 512*(int(infolist[5]) + int(infolist[9]))
+	return total
+
 def argonsysinfo_getip():
 	ipaddr = ""
 	st = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
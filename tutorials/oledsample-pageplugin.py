@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+
+#
+# Sample custom OLED page, shows uptime and load averages
+#
+# Copy to /etc/argon/pages.d/uptime.py, then add the "uptime" page with argon-oledconfig
+# and restart the service. The file name is the page name.
+#
+# page_provider runs in its own worker thread and can take up to PAGE_BUDGET seconds,
+# page_render should only format the data, the page is disabled if it keeps taking more than
+# ARGONEONPAGES_RENDERBUDGET seconds. Loading this file has the same kind of limit.
+#
+
+import sys
+sys.path.append("/etc/argon/")
+from argoneonpages import *
+
+PAGE_TITLE = "Uptime and Load"
+PAGE_INTERVAL = 30
+PAGE_BUDGET = 2
+
+PAGE_LAYOUT = {
+	"bg": "bgblack",
+	"labels": [
+		argoneonpages_label("UPTIME", 0, 0, 128, 1),
+		argoneonpages_label("LOAD", 0, 40, 128, 1)
+	],
+	"fields": [
+		argoneonpages_textfield("uptime", 0, 16, 128, 1, ARGONEONPAGES_FONTREG),
+		argoneonpages_textfield("load", 0, 52, 128, 1)
+	]
+}
+
+def page_provider():
+	with open("/proc/uptime", "r") as fp:
+		uptimesec = int(float(fp.read().split(" ")[0]))
+	with open("/proc/loadavg", "r") as fp:
+		loadlist = fp.read().split(" ")[0:3]
+	return {"uptime": uptimesec, "load": loadlist}
+
+def page_render(data):
+	uptimesec = data["uptime"]
+	outstr = str(uptimesec//3600 % 24)+"h"+str(uptimesec//60 % 60).zfill(2)
+	if uptimesec >= 86400:
+		outstr = str(uptimesec//86400)+"d "+outstr
+	return {"uptime": outstr, "load": " ".join(data["load"])}
+
+
+if __name__ == "__main__":
+	# Preview the values
+	print(page_render(page_provider()))
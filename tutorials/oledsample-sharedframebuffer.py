@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+
+#
+# Draws on the OLED while the Argon service is running, through the shared framebuffer
+#
+# Shows a progress bar at the bottom of the current page, then a full screen message
+# for a few seconds. The service draws its page again afterwards.
+#
+
+import os
+if os.path.exists("/etc/argon/argoneonshared.py"):
+	import sys
+	import time
+	sys.path.append("/etc/argon/")
+	from argoneonshared import *
+else:
+	print("Please install Argon script")
+	exit()
+
+try:
+	argoneonshared_connect()
+except FileNotFoundError:
+	print("Argon service not running, or OLED disabled")
+	exit()
+except PermissionError:
+	print("Please run as root (sudo)")
+	exit()
+
+# Bottom 16 rows, released automatically after 60 seconds in case the script is stopped
+argoneonshared_claim(0, 48, oled_getmaxX(), 16, 60)
+
+progress = 0
+while progress <= 100:
+	oled_clearbuffer()
+	oled_writetextaligned("Backup "+str(progress)+"%", 0, 48, oled_getmaxX(), 1, 6)
+	oled_drawbargraph(4, 58, oled_getmaxX()-8, 4, progress)
+	argoneonshared_publish()
+	time.sleep(0.2)
+	progress = progress + 5
+
+# Whole screen for 5 seconds
+# With OledSharedBackend, oled_flushimage publishes the frame
+argoneonshared_takeover(5)
+oled_setbackend(OledSharedBackend())
+oled_clearbuffer()
+oled_writetextaligned("Done!", 0, 24, oled_getmaxX(), 1, 8)
+oled_flushimage()
+time.sleep(5)
+
+argoneonshared_release()